@@ -0,0 +1,258 @@
+# Benchmarks the filesystem and data commands on synthetic trees.
+#
+#   python benchmarks/commands.py [--sizes 1000,10000] [--repeat 3] [--json out.json]
+#   python benchmarks/commands.py --compare old.json new.json [--threshold 1.2]
+#
+# Every run builds its trees in a temporary directory, times each command
+# through AdvancedCMD.execute() with output sent to /dev/null, and reports
+# the best of --repeat runs. The "scaling" column is the slope of
+# log(time) over log(size): ~1 is linear, ~2 quadratic.
+
+import argparse
+import contextlib
+import datetime
+import json
+import math
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import AdvancedCMD  # noqa: E402
+
+SHAPES = ("wide", "deep", "small", "huge")
+
+
+def write_file(path, size):
+    with open(path, "wb") as f:
+        f.write(os.urandom(min(size, 4096)) * (size // 4096) + os.urandom(size % 4096))
+
+
+def build_tree(root, shape, count):
+    # wide: one directory; deep: a long chain; small: fan-out of 10 per
+    # level; huge: a few large files (count / 1000 MB in total).
+    os.makedirs(root)
+    if shape == "wide":
+        for i in range(count):
+            write_file(os.path.join(root, f"file_{i}.log" if i % 10 == 0 else f"file_{i}.txt"), 64)
+    elif shape == "deep":
+        path = root
+        for i in range(count):
+            if i % 10 == 0:
+                path = os.path.join(path, f"d{i}")
+                os.mkdir(path)
+            write_file(os.path.join(path, f"file_{i}.log" if i % 10 == 0 else f"file_{i}.txt"), 64)
+    elif shape == "small":
+        for i in range(count):
+            folder = os.path.join(root, *[f"d{digit}" for digit in str(i // 10).zfill(3)[-3:]])
+            os.makedirs(folder, exist_ok=True)
+            write_file(os.path.join(folder, f"file_{i}.log" if i % 10 == 0 else f"file_{i}.txt"), 512)
+    elif shape == "huge":
+        files = 4
+        for i in range(files):
+            write_file(os.path.join(root, f"big_{i}.bin"), count * 1024 * 1024 // 1000 // files)
+
+
+def build_diff_pair(folder, lines):
+    rng = random.Random(lines)
+    first = [f"{i},{rng.random():.6f},row {i}\n" for i in range(lines)]
+    second = list(first)
+    for _ in range(max(1, lines // 100)):
+        second[rng.randrange(lines)] = f"changed,{rng.random():.6f}\n"
+    paths = os.path.join(folder, "a.csv"), os.path.join(folder, "b.csv")
+    for path, content in zip(paths, (first, second)):
+        with open(path, "w") as f:
+            f.writelines(content)
+    return paths
+
+
+def build_image(folder, count):
+    try:
+        from PIL import Image
+    except ImportError:
+        return None
+    side = max(64, int(math.sqrt(count)) * 8)
+    path = os.path.join(folder, "image.png")
+    Image.effect_noise((side, side), 64).convert("RGB").save(path)
+    return path
+
+
+def best_of(shell, command, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        shell.execute(command)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def run_suite(sizes, repeat, workdir):
+    AdvancedCMD.setup_colors(False)
+    results = []
+    devnull = open(os.devnull, "w")
+    cwd = os.getcwd()
+    try:
+        with contextlib.redirect_stdout(devnull):
+            for size in sizes:
+                for shape in SHAPES:
+                    root = os.path.join(workdir, f"{shape}_{size}")
+                    build_tree(root, shape, size)
+                    os.chdir(root)
+                    shell = AdvancedCMD.AdvancedCMD()
+                    backups = os.path.join(workdir, "backups")
+                    commands = [
+                        ("dir", f"dir {root}"),
+                        ("du", f"du {root}"),
+                        ("find", "find .log"),
+                        ("recent", f"recent {root} 7"),
+                        ("backup", f"backup {root} {backups}"),
+                    ]
+                    for name, command in commands:
+                        seconds = best_of(shell, command, repeat,
+                                          setup=lambda: shutil.rmtree(backups, ignore_errors=True))
+                        results.append({"command": name, "shape": shape, "size": size, "seconds": seconds})
+                    # Repeated syncs must update the mirror in place: time the
+                    # runs after the first copy, then check nothing was nested.
+                    mirror = os.path.join(workdir, "mirror")
+                    sync = f"copy {root} {mirror} --skip mtime"
+                    shell.execute(sync)
+                    results.append({"command": "copy sync", "shape": shape, "size": size,
+                                    "seconds": best_of(shell, sync, repeat)})
+                    check_mirror(root, mirror)
+                    os.chdir(cwd)
+                    shutil.rmtree(root)
+                    shutil.rmtree(backups, ignore_errors=True)
+                    shutil.rmtree(mirror)
+
+                data = os.path.join(workdir, f"data_{size}")
+                os.makedirs(data)
+                os.chdir(data)
+                shell = AdvancedCMD.AdvancedCMD()
+                first, second = build_diff_pair(data, size * 10)
+                results.append({"command": "diff", "shape": "csv", "size": size,
+                                "seconds": best_of(shell, f"diff {first} {second}", repeat)})
+                image = build_image(data, size)
+                if image:
+                    results.append({"command": "asciiart", "shape": "png", "size": size,
+                                    "seconds": best_of(shell, f"asciiart {image}", repeat)})
+                results.extend(persistence_results(shell, size, repeat))
+                os.chdir(cwd)
+                shutil.rmtree(data)
+    finally:
+        os.chdir(cwd)
+        devnull.close()
+    return results
+
+
+def tree_files(root):
+    return {os.path.relpath(os.path.join(path, name), root) for path, dirs, files in os.walk(root) for name in files}
+
+
+def check_mirror(source, mirror):
+    if tree_files(source) != tree_files(mirror):
+        sys.exit(f"copy --skip did not leave {mirror} an exact mirror of {source}")
+
+
+def persistence_results(shell, size, repeat):
+    shell.todo_list = [{"text": f"task {i}", "done": i % 3 == 0, "created": "2024-01-01T00:00:00"}
+                       for i in range(size)]
+    shell.agenda = [{"id": i + 1, "date": "2024-01-01", "time": "10:00", "title": f"event {i}",
+                     "created": "2024-01-01T00:00:00"} for i in range(size)]
+    results = []
+    for name, func in (("todo.save", shell.save_todo_list), ("todo.load", shell.load_todo_list),
+                       ("agenda.save", shell.save_agenda), ("agenda.load", shell.load_agenda)):
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            times.append(time.perf_counter() - start)
+        results.append({"command": name, "shape": "json", "size": size, "seconds": min(times)})
+    results.append({"command": "todo add", "shape": "json", "size": size,
+                    "seconds": best_of(shell, "todo add benchmark task", repeat)})
+    return results
+
+
+def scaling(results):
+    # Slope of log(seconds) against log(size) between the smallest and largest size.
+    series = {}
+    for result in results:
+        series.setdefault((result["command"], result["shape"]), []).append((result["size"], result["seconds"]))
+    slopes = {}
+    for key, points in series.items():
+        points.sort()
+        (n1, t1), (n2, t2) = points[0], points[-1]
+        if n2 > n1 and t1 > 0 and t2 > 0:
+            slopes[key] = math.log(t2 / t1) / math.log(n2 / n1)
+    return slopes
+
+
+def print_report(results):
+    slopes = scaling(results)
+    print(f"{'Command':<12} {'Shape':<6} {'Size':>8} {'Seconds':>10} {'Scaling':>8}")
+    print("-" * 48)
+    for result in results:
+        slope = slopes.get((result["command"], result["shape"]))
+        slope_text = f"{slope:.2f}" if slope is not None and result["size"] == max(
+            r["size"] for r in results if (r["command"], r["shape"]) == (result["command"], result["shape"])) else ""
+        print(f"{result['command']:<12} {result['shape']:<6} {result['size']:>8} {result['seconds']:>10.4f} {slope_text:>8}")
+
+
+def compare(old_path, new_path, threshold):
+    with open(old_path) as f:
+        old = {(r["command"], r["shape"], r["size"]): r["seconds"] for r in json.load(f)["results"]}
+    with open(new_path) as f:
+        new = {(r["command"], r["shape"], r["size"]): r["seconds"] for r in json.load(f)["results"]}
+    regressions = 0
+    print(f"{'Command':<12} {'Shape':<6} {'Size':>8} {'Old':>10} {'New':>10} {'Ratio':>7}")
+    print("-" * 58)
+    for key in sorted(old.keys() & new.keys()):
+        ratio = new[key] / old[key] if old[key] > 0 else float("inf")
+        flag = ""
+        if ratio > threshold:
+            flag = "  REGRESSION"
+            regressions += 1
+        elif ratio < 1 / threshold:
+            flag = "  faster"
+        print(f"{key[0]:<12} {key[1]:<6} {key[2]:>8} {old[key]:>10.4f} {new[key]:>10.4f} {ratio:>6.2f}x{flag}")
+    print(f"\n{regressions} regression(s) above {threshold:.2f}x")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AdvancedCMD command benchmarks")
+    parser.add_argument("--sizes", default="1000,10000", help="comma-separated file counts")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--compare", nargs=2, metavar=("OLD", "NEW"), help="compare two result files")
+    parser.add_argument("--threshold", type=float, default=1.2, help="slow-down ratio reported as a regression")
+    opts = parser.parse_args()
+
+    if opts.compare:
+        sys.exit(compare(opts.compare[0], opts.compare[1], opts.threshold))
+
+    sizes = [int(size) for size in opts.sizes.split(",")]
+    workdir = tempfile.mkdtemp(prefix="advancedcmd-bench-")
+    try:
+        results = run_suite(sizes, opts.repeat, workdir)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump({"benchmark": "commands",
+                       "meta": {"python": platform.python_version(), "platform": platform.platform(),
+                                "date": datetime.datetime.now().isoformat(timespec="seconds"),
+                                "sizes": sizes, "repeat": opts.repeat},
+                       "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
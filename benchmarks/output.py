@@ -0,0 +1,90 @@
+# Measures how many lines per second the shell can print, before and after the
+# buffered output layer (Output.install) and the no-colour fast path.
+#
+#   python benchmarks/output.py [--lines N] [--json results.json]
+#
+# "terminal" runs write to a pseudo-terminal (where Python line-buffers
+# stdout, i.e. one write syscall per line, and install() keeps it that way so
+# streamed output stays live); "pipe" runs write to /dev/null and get the
+# 64 KB buffer.
+
+import argparse
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+import AdvancedCMD  # noqa: E402
+import colorama  # noqa: E402
+from colorama import Fore, Style  # noqa: E402
+
+
+def drain(fd):
+    try:
+        while os.read(fd, 1 << 16):
+            pass
+    except OSError:
+        pass
+
+
+def print_rows(lines, fore, style):
+    for i in range(lines):
+        print(f"{fore.GREEN}{i:>10} file_{i}.txt{style.RESET_ALL}")
+    sys.stdout.flush()
+
+
+def run_case(fd, lines, buffered, color):
+    saved = sys.stdout
+    sys.stdout = io.TextIOWrapper(io.FileIO(fd, 'w', closefd=False), encoding="utf-8",
+                                  line_buffering=os.isatty(fd))
+    if buffered:
+        AdvancedCMD.Output().install()
+    else:
+        # What colorama.init() used to do at import: strip codes through a
+        # regex-based wrapper whenever stdout is not a terminal.
+        wrapper = colorama.AnsiToWin32(sys.stdout)
+        if wrapper.should_wrap():
+            sys.stdout = wrapper.stream
+    fore, style = (Fore, Style) if color else (AdvancedCMD.NoColor(Fore), AdvancedCMD.NoColor(Style))
+    try:
+        start = time.perf_counter()
+        print_rows(lines, fore, style)
+        elapsed = time.perf_counter() - start
+    finally:
+        sys.stdout = saved
+    return lines / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AdvancedCMD output benchmark")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--json", help="write results to this file")
+    opts = parser.parse_args()
+
+    targets = []
+    if hasattr(os, "openpty"):
+        master, slave = os.openpty()
+        threading.Thread(target=drain, args=(master,), daemon=True).start()
+        targets.append(("terminal", slave))
+    targets.append(("pipe", os.open(os.devnull, os.O_WRONLY)))
+
+    results = []
+    for target, fd in targets:
+        cases = [("before", False, True), ("after", True, target == "terminal")]
+        for label, buffered, color in cases:
+            rate = run_case(fd, opts.lines, buffered, color)
+            results.append({"target": target, "case": label, "buffered": buffered,
+                            "color": color, "lines_per_sec": rate})
+            print(f"{target:<9} {label:<7} buffered={buffered!s:<5} color={color!s:<5} {rate:>12,.0f} lines/sec")
+
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump({"benchmark": "output", "lines": opts.lines, "results": results}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+# Measures time-to-prompt: how long it takes from launching AdvancedCMD.py
+# until the interactive prompt has been written to stdout.
+#
+#   python benchmarks/startup.py [--runs N] [--json results.json]
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src", "AdvancedCMD.py")
+PROMPT = b"Advanced CMD > "
+
+
+def time_to_prompt(python):
+    start = time.perf_counter()
+    proc = subprocess.Popen([python, SCRIPT], stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            stderr=subprocess.DEVNULL)
+    seen = b""
+    try:
+        while PROMPT not in seen:
+            chunk = os.read(proc.stdout.fileno(), 4096)
+            if not chunk:
+                raise RuntimeError("AdvancedCMD exited before showing a prompt")
+            seen = seen[-len(PROMPT):] + chunk
+        elapsed = time.perf_counter() - start
+    finally:
+        proc.communicate(b"exit\n", timeout=10)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="AdvancedCMD startup benchmark")
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--python", default=sys.executable)
+    parser.add_argument("--json", help="write results to this file")
+    opts = parser.parse_args()
+
+    time_to_prompt(opts.python)  # warm the bytecode and filesystem caches
+    samples = [time_to_prompt(opts.python) for _ in range(opts.runs)]
+
+    result = {
+        "benchmark": "time_to_prompt",
+        "runs": opts.runs,
+        "min_ms": min(samples) * 1000,
+        "median_ms": statistics.median(samples) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+    print(f"time to prompt over {opts.runs} runs: "
+          f"min {result['min_ms']:.1f} ms, median {result['median_ms']:.1f} ms, max {result['max_ms']:.1f} ms")
+    if opts.json:
+        with open(opts.json, "w") as f:
+            json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
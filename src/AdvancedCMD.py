@@ -10,41 +10,2095 @@ import threading
 import json
 import hashlib
 import zipfile
-import difflib
 import math
 import re
 import base64
 import calendar
-import urllib.parse
-import urllib.request
 import getpass
-from pathlib import Path
+import bisect
+import heapq
+import io
+import itertools
+from array import array
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 
+INSTALL_HINT = "Install with: pip install colorama psutil requests pyfiglet pillow cryptography"
+
+# psutil, requests, pyfiglet, cryptography and PIL are imported inside the
+# commands that use them, so starting the shell only pays for colorama.
 try:
     import colorama
     from colorama import Fore, Back, Style
-    import psutil
-    import requests
-    import pyfiglet
-    from cryptography.fernet import Fernet
-    from PIL import Image
-    colorama.init()
 except ImportError as e:
     print(f"Missing required library: {e}")
-    print("Install with: pip install colorama psutil requests pyfiglet pillow cryptography")
+    print(INSTALL_HINT)
     sys.exit(1)
 
+
+class JobCancelled(BaseException):
+    # BaseException, like KeyboardInterrupt, so handlers' `except Exception`
+    # blocks do not swallow a cancellation.
+    pass
+
+
+# Per-thread state shared by the shell and its job output router; a worker
+# thread running a background job has `job` set.
+thread_state = threading.local()
+
+
+class Job:
+    def __init__(self, job_id, command):
+        self.id = job_id
+        self.command = command
+        self.future = None
+        self.state = "pending"
+        self.status = None
+        self.started = None
+        self.finished = None
+        self.reported = False
+        self.cancel_event = threading.Event()
+        self.chunks = []
+        self.changed = threading.Condition()
+
+    def write(self, text):
+        with self.changed:
+            self.chunks.append(text)
+            self.changed.notify_all()
+
+    def output(self):
+        with self.changed:
+            return "".join(self.chunks)
+
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+
+class JobOutput:
+    # Installed as sys.stdout once background jobs exist or output is paged;
+    # writes from a job's worker thread go to that job's buffer, writes from
+    # a thread with a sink (the pager's capture) go to the sink, everything
+    # else to the terminal.
+    def __init__(self, stream):
+        self.stream = stream
+
+    def target(self):
+        job = getattr(thread_state, 'job', None)
+        if job is not None:
+            return job
+        return getattr(thread_state, 'sink', None)
+
+    def write(self, text):
+        target = self.target()
+        if target is None:
+            return self.stream.write(text)
+        target.write(text)
+        return len(text)
+
+    def flush(self):
+        if self.target() is None:
+            self.stream.flush()
+
+    def isatty(self):
+        return self.target() is None and self.stream.isatty()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+class History:
+    # Append-only history file shared by every shell: one line per command,
+    # "timestamp<TAB>duration_ms<TAB>status<TAB>command", written with a
+    # single O_APPEND write so concurrent shells never interleave entries.
+    # The file is only read when searched, and then incrementally from the
+    # last offset. Substring search scans one lower-cased blob with
+    # str.rfind; prefix search bisects a sorted list of distinct commands.
+    def __init__(self, path):
+        self.path = path
+        self.offset = 0
+        self.commands = []
+        self.timestamps = array('d')
+        self.durations = array('d')
+        self.statuses = array('i')
+        self.blob = ""
+        self.starts = array('q')
+        self.sorted_commands = []
+        self.last_index = {}
+
+    def append(self, command, duration, status):
+        line = f"{time.time():.3f}\t{duration * 1000:.1f}\t{status}\t{command.replace(chr(9), ' ')}\n"
+        try:
+            with open(self.path, 'ab') as f:
+                f.write(line.encode('utf-8'))
+        except OSError:
+            pass
+
+    def recent(self, count):
+        # Reads only the tail of the file; used to seed readline at startup.
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                start = max(0, f.tell() - 256 * count)
+                f.seek(start)
+                lines = f.read().decode('utf-8', 'replace').splitlines()
+                if start:
+                    # The first line is probably cut short by the seek.
+                    del lines[0]
+        except OSError:
+            return []
+        return [line.split('\t', 3)[3] for line in lines[-count:] if line.count('\t') >= 3]
+
+    def refresh(self):
+        try:
+            with open(self.path, 'rb') as f:
+                f.seek(0, os.SEEK_END)
+                if f.tell() < self.offset:
+                    self.__init__(self.path)
+                f.seek(self.offset)
+                data = f.read()
+        except OSError:
+            return
+        end = data.rfind(b'\n') + 1
+        rows = [line.split('\t', 3) for line in data[:end].decode('utf-8', 'replace').splitlines()]
+        rows = [row for row in rows if len(row) == 4]
+        columns = self.parse_rows(rows) if rows else None
+        self.offset += end
+        if not columns:
+            return
+        timestamps, durations, statuses, commands = columns
+        self.commands.extend(commands)
+        self.timestamps.extend(timestamps)
+        self.durations.extend(durations)
+        self.statuses.extend(statuses)
+        self.update_index()
+
+    def parse_rows(self, rows):
+        # Converts whole columns at once; if a row is malformed (a torn write,
+        # a hand edit) the rows are checked one by one and only bad ones skipped.
+        try:
+            timestamps, durations, statuses, commands = zip(*rows)
+            return (array('d', map(float, timestamps)), array('d', map(float, durations)),
+                    array('i', map(int, statuses)), commands)
+        except (ValueError, OverflowError):
+            pass
+        good = []
+        for row in rows:
+            try:
+                float(row[0]), float(row[1]), array('i', [int(row[2])])
+            except (ValueError, OverflowError):
+                continue
+            good.append(row)
+        return self.parse_rows(good) if good else None
+
+    def update_index(self):
+        first = len(self.starts)
+        if first == len(self.commands):
+            return
+        lowered = [command.lower() for command in itertools.islice(self.commands, first, None)]
+        position = len(self.blob)
+        self.starts.extend(itertools.accumulate((len(text) + 1 for text in lowered[:-1]), initial=position))
+        self.blob += "\n".join(lowered) + "\n"
+        added = [text for text in lowered if text not in self.last_index]
+        self.last_index.update(zip(lowered, range(first, len(self.commands))))
+        if len(added) > 64:
+            self.sorted_commands = sorted(self.last_index)
+        else:
+            for text in added:
+                bisect.insort(self.sorted_commands, text)
+
+    def __len__(self):
+        return len(self.commands)
+
+    def search(self, pattern, limit):
+        # Newest matches first.
+        self.refresh()
+        needle = pattern.lower()
+        matches = []
+        end = len(self.blob)
+        while len(matches) < limit:
+            position = self.blob.rfind(needle, 0, end)
+            if position < 0:
+                break
+            index = bisect.bisect_right(self.starts, position) - 1
+            matches.append(index)
+            end = self.starts[index]
+        return matches
+
+    def prefix(self, prefix, limit):
+        self.refresh()
+        prefix = prefix.lower()
+        found = []
+        for lowered in itertools.islice(self.sorted_commands, bisect.bisect_left(self.sorted_commands, prefix), None):
+            if not lowered.startswith(prefix):
+                break
+            found.append(self.last_index[lowered])
+        return sorted(found, reverse=True)[:limit]
+
+    def slowest(self, limit):
+        self.refresh()
+        return heapq.nlargest(limit, range(len(self.durations)), key=self.durations.__getitem__)
+
+    def failed(self, limit):
+        self.refresh()
+        return list(itertools.islice((i for i in range(len(self.statuses) - 1, -1, -1) if self.statuses[i]), limit))
+
+    def last(self, limit):
+        self.refresh()
+        return list(range(len(self.commands) - 1, max(-1, len(self.commands) - 1 - limit), -1))
+
+
+class LatencyHistogram:
+    # Per-command latency in power-of-two microsecond buckets: recording is a
+    # bit_length() and a few integer adds, so it stays on for every command.
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.buckets = [0] * 48
+        self.lock = threading.Lock()
+
+    def record(self, seconds):
+        bucket = min(int(seconds * 1e6).bit_length(), 47)
+        with self.lock:
+            self.count += 1
+            self.total += seconds
+            self.buckets[bucket] += 1
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, fraction):
+        # Upper edge of the bucket holding the requested rank.
+        rank = fraction * self.count
+        seen = 0
+        for bucket, hits in enumerate(self.buckets):
+            seen += hits
+            if hits and seen >= rank:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+
+class CpuSampler:
+    # psutil's cpu_percent compares two readings, so a fresh call either
+    # blocks for an interval or returns 0.0. This daemon thread takes a
+    # reading every interval (the first after 0.1 s) and keeps the latest
+    # system-wide, per-CPU and per-process figures plus a rolling history,
+    # so callers answer at once. It starts on first use and exits after
+    # idle seconds without a caller.
+    def __init__(self, interval=1.0, idle=30.0):
+        self.interval = interval
+        self.idle = idle
+        self.lock = threading.Lock()
+        self.ready = threading.Event()
+        self.thread = None
+        self.used = 0.0
+        self.system = 0.0
+        self.per_cpu = []
+        self.processes = []
+        self.history = deque(maxlen=60)
+
+    def touch(self):
+        with self.lock:
+            self.used = time.monotonic()
+            if self.thread is None:
+                self.ready.clear()
+                self.history.clear()
+                self.thread = threading.Thread(target=self.run, name="cpu-sampler", daemon=True)
+                self.thread.start()
+        self.ready.wait(self.interval + 1)
+
+    def run(self):
+        try:
+            import psutil
+            psutil.cpu_percent(None)
+            psutil.cpu_percent(None, percpu=True)
+            self.sample_processes(psutil)
+            delay = 0.1
+            while True:
+                time.sleep(delay)
+                delay = self.interval
+                self.system = psutil.cpu_percent(None)
+                self.per_cpu = psutil.cpu_percent(None, percpu=True)
+                self.processes = self.sample_processes(psutil)
+                self.history.append(self.system)
+                self.ready.set()
+                with self.lock:
+                    if time.monotonic() - self.used > self.idle:
+                        self.thread = None
+                        return
+        except Exception:
+            # No psutil, or it failed: callers see the last figures (or zeros).
+            with self.lock:
+                self.thread = None
+            self.ready.set()
+
+    def sample_processes(self, psutil):
+        # process_iter reuses its Process objects, so cpu_percent(None)
+        # measures each process since the previous sample.
+        processes = []
+        for proc in psutil.process_iter(['name']):
+            try:
+                processes.append({'pid': proc.pid, 'name': proc.info['name'] or '',
+                                  'cpu_percent': proc.cpu_percent(None)})
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+        return processes
+
+    def percent(self):
+        self.touch()
+        return self.system
+
+    def recent(self, count):
+        self.touch()
+        return list(self.history)[-count:]
+
+    def top_processes(self, count=None):
+        self.touch()
+        processes = sorted(self.processes, key=lambda proc: proc['cpu_percent'], reverse=True)
+        return processes if count is None else processes[:count]
+
+    def process_percent(self, pid):
+        self.touch()
+        return next((proc['cpu_percent'] for proc in self.processes if proc['pid'] == pid), 0.0)
+
+
+class TreeWalker:
+    # Walks a directory tree with os.scandir on a thread pool, one task per
+    # directory, so readdir/stat latency on network shares and fast SSDs
+    # overlaps instead of adding up. walk() yields (path, depth, dirs, files)
+    # in completion order: dirs are names, files are (name, stat_result)
+    # pairs, or (name, None) with stat_files=False. Symlinks are not
+    # followed and unreadable directories are counted in self.errors.
+    def __init__(self, workers=None, hidden=False, stat_files=True, check=None):
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.hidden = hidden
+        self.stat_files = stat_files
+        self.check = check
+        self.errors = 0
+
+    def scan(self, path):
+        dirs = []
+        files = []
+        try:
+            with os.scandir(path) as it:
+                for entry in it:
+                    name = entry.name
+                    if not self.hidden and name.startswith('.'):
+                        continue
+                    try:
+                        if entry.is_dir(follow_symlinks=False):
+                            dirs.append(name)
+                        elif self.stat_files:
+                            files.append((name, entry.stat(follow_symlinks=False)))
+                        else:
+                            files.append((name, None))
+                    except OSError:
+                        continue
+        except OSError:
+            return path, None, None
+        return path, dirs, files
+
+    def walk(self, top, max_depth=None):
+        import queue
+        top = os.path.normpath(top)
+        done = queue.Queue()
+        pool = ThreadPoolExecutor(self.workers)
+        depths = {}
+        try:
+            pending = 1
+            depths[top] = 0
+            pool.submit(self.scan, top).add_done_callback(done.put)
+            while pending:
+                future = done.get()
+                pending -= 1
+                path, dirs, files = future.result()
+                depth = depths.pop(path)
+                if self.check:
+                    self.check()
+                if dirs is None:
+                    self.errors += 1
+                    continue
+                if max_depth is None or depth < max_depth:
+                    for name in dirs:
+                        child = os.path.join(path, name)
+                        depths[child] = depth + 1
+                        pending += 1
+                        pool.submit(self.scan, child).add_done_callback(done.put)
+                yield path, depth, dirs, files
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+
+class SqliteCache:
+    # Base for the on-disk sqlite caches: one table whose rows carry a
+    # "used" timestamp. When the file grows past max_bytes, the least
+    # recently used rows are dropped until it is back to 3/4 of the limit.
+    max_bytes = 64 * 1024 * 1024
+    table = None
+
+    def __init__(self, path):
+        self.path = path
+
+    def storable(self, path):
+        # Undecodable file names (surrogate escapes) cannot be stored as text.
+        try:
+            path.encode('utf-8')
+            return True
+        except UnicodeEncodeError:
+            return False
+
+    def evict(self, db):
+        size = os.path.getsize(self.path)
+        if size <= self.max_bytes:
+            return
+        count = db.execute(f"SELECT COUNT(*) FROM {self.table}").fetchone()[0]
+        keep = int(count * self.max_bytes * 0.75 / size)
+        with db:
+            db.execute(f"DELETE FROM {self.table} WHERE rowid IN "
+                       f"(SELECT rowid FROM {self.table} ORDER BY used LIMIT ?)", (max(count - keep, 1),))
+        db.execute("VACUUM")
+
+
+class DuCache(SqliteCache):
+    # On-disk cache of per-directory disk usage (sqlite), so a rerun of du
+    # only rescans directories whose inode or mtime changed. A row holds the
+    # directory's own files only: apparent size, allocated blocks, file
+    # count, subfolder names and its hard-linked files, which are kept apart
+    # so they can still be counted once across the whole tree. Editing a
+    # file in place does not touch its directory's mtime; du --refresh
+    # rescans everything.
+    table = "dirs"
+
+    def connect(self):
+        import sqlite3
+        db = sqlite3.connect(self.path, timeout=5)
+        db.execute("CREATE TABLE IF NOT EXISTS dirs (path TEXT PRIMARY KEY, ino INTEGER, mtime INTEGER, "
+                   "size INTEGER, blocks INTEGER, files INTEGER, subdirs TEXT, links TEXT, used REAL)")
+        return db
+
+    def bounds(self, root):
+        prefix = root if root.endswith(os.sep) else root + os.sep
+        return root, prefix, prefix[:-1] + chr(ord(os.sep) + 1)
+
+    def load(self, root):
+        import sqlite3
+        try:
+            db = self.connect()
+            try:
+                rows = db.execute("SELECT path, ino, mtime, size, blocks, files, subdirs, links FROM dirs "
+                                  "WHERE path = ? OR (path >= ? AND path < ?)", self.bounds(root)).fetchall()
+            finally:
+                db.close()
+        except (sqlite3.Error, UnicodeEncodeError):
+            return {}
+        return {row[0]: row[1:] for row in rows}
+
+    def save(self, root, rows, stale):
+        import sqlite3
+        try:
+            db = self.connect()
+            try:
+                with db:
+                    db.executemany("DELETE FROM dirs WHERE path = ?", ((path,) for path in stale))
+                    db.executemany("INSERT OR REPLACE INTO dirs VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                                   (row for row in rows if self.storable(row[0])))
+                    db.execute("UPDATE dirs SET used = ? WHERE path = ? OR (path >= ? AND path < ?)",
+                               (time.time(),) + self.bounds(root))
+                self.evict(db)
+            finally:
+                db.close()
+        except (sqlite3.Error, UnicodeEncodeError, OSError):
+            pass
+
+
+class DuWalker(TreeWalker):
+    # TreeWalker for du: instead of stat results, each directory yields a
+    # summary row (ino, mtime_ns, size, blocks, files, links, fresh). Rows
+    # from `cached` are reused when the directory's inode and mtime match.
+    def __init__(self, cached, check=None):
+        super().__init__(check=check)
+        self.cached = cached
+
+    def scan(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return path, None, None
+        row = self.cached.get(path)
+        if row is not None and row[0] == st.st_ino and row[1] == st.st_mtime_ns:
+            return path, json.loads(row[5]), row[:5] + (json.loads(row[6]), False)
+        path, dirs, files = super().scan(path)
+        if dirs is None:
+            return path, None, None
+        size = blocks = count = 0
+        links = []
+        for name, st_file in files:
+            file_blocks = getattr(st_file, 'st_blocks', 0)
+            if st_file.st_nlink > 1 and st_file.st_ino:
+                links.append((st_file.st_dev, st_file.st_ino, st_file.st_size, file_blocks))
+                continue
+            size += st_file.st_size
+            blocks += file_blocks
+            count += 1
+        return path, dirs, (st.st_ino, st.st_mtime_ns, size, blocks, count, links, True)
+
+
+def glob_to_regex(pattern):
+    # Like fnmatch.translate, but wildcards never match a newline, so the
+    # result also works on one line of a newline-separated blob (with
+    # re.MULTILINE). A leading or trailing "*" just drops the anchor, which
+    # lets the regex engine use its fast literal scan.
+    parts = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i]
+        i += 1
+        if char == '*':
+            parts.append('[^\n]*')
+        elif char == '?':
+            parts.append('[^\n]')
+        elif char == '[':
+            end = i + 1 if pattern[i:i + 1] == '!' else i
+            end = pattern.find(']', end + 1 if pattern[end:end + 1] == ']' else end)
+            if end < 0:
+                parts.append('\\[')
+                continue
+            body = pattern[i:end].replace('\\', '\\\\')
+            i = end + 1
+            if body.startswith('!'):
+                body = '^\n' + body[1:]
+            elif body.startswith('^'):
+                body = '\\' + body
+            parts.append(f'[{body}]')
+        else:
+            parts.append(re.escape(char))
+    start = '^'
+    end = '$'
+    if parts[:1] == ['[^\n]*']:
+        parts, start = parts[1:], ''
+    if parts[-1:] == ['[^\n]*']:
+        parts, end = parts[:-1], ''
+    return start + ''.join(parts) + end
+
+
+def name_regex(term, glob=False, regex=False):
+    # Regex source matched (with search) against a single file name.
+    if glob:
+        return glob_to_regex(term)
+    if regex:
+        return term
+    return re.escape(term)
+
+
+class FindIndex:
+    # Locate-style file name index, built by "find --update <path>". One file
+    # of raw file-system bytes: a "\x03" line listing the indexed roots, then
+    # per directory a "\x01<path>\t<ino>\t<mtime_ns>" header, "\x02<name>"
+    # lines for its subfolders and one line per file name. A query runs a
+    # single compiled bytes regex over the whole file, so no Python code runs
+    # per entry; only matches are turned into paths. Updates reuse the
+    # section of every directory whose inode and mtime are unchanged.
+    def __init__(self, path):
+        self.path = path
+
+    def read(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return b""
+
+    def roots(self, blob):
+        if not blob.startswith(b'\x03'):
+            return []
+        return [os.fsdecode(root) for root in blob[1:blob.find(b'\n')].split(b'\0') if root]
+
+    def covers(self, blob, folder):
+        return any(folder == root or folder.startswith(root.rstrip(os.sep) + os.sep) for root in self.roots(blob))
+
+    def search(self, blob, pattern, scope, fold=False):
+        # pattern: compiled bytes regex for one name, run with re.MULTILINE
+        # over the blob (lower-cased first with fold=True); yields absolute
+        # paths of matching files below `scope`.
+        rx = re.compile(pattern.pattern, pattern.flags | re.M)
+        haystack = blob.lower() if fold else blob
+        scope = os.fsencode(scope)
+        prefix = scope.rstrip(os.sep.encode()) + os.sep.encode()
+        header_end = 0
+        line_start = -1
+        folder = None
+        inside = False
+        for match in rx.finditer(haystack, blob.find(b'\n')):
+            start = blob.rfind(b'\n', 0, match.start() + 1) + 1
+            if start == line_start or blob[start] in (1, 2):
+                continue
+            line_start = start
+            header = blob.rfind(b'\n\x01', header_end, start)
+            if header >= 0:
+                header_end = blob.find(b'\n', header + 1)
+                folder = blob[header + 2:header_end].split(b'\t', 1)[0]
+                inside = folder == scope or folder.startswith(prefix)
+            if inside:
+                yield os.fsdecode(os.path.join(folder, blob[start:blob.find(b'\n', start)]))
+
+    def sections(self, blob):
+        parts = blob.split(b'\n\x01')[1:]
+        sections = {}
+        for i, part in enumerate(parts):
+            path = os.fsdecode(part[:part.find(b'\t')])
+            sections[path] = b'\x01' + part + (b'\n' if i < len(parts) - 1 else b'')
+        return sections
+
+    def update(self, root, check=None):
+        # Returns (folders indexed, folders rescanned) for `root`.
+        root = os.path.abspath(root)
+        prefix = root.rstrip(os.sep) + os.sep
+        blob = self.read()
+        roots = self.roots(blob)
+        sections = self.sections(blob)
+        walker = IndexWalker(sections, check=check)
+        fresh = {path: section for path, depth, dirs, section in walker.walk(root)}
+        rescanned = sum(1 for path, section in fresh.items() if sections.get(path) is not section)
+        kept = {path: section for path, section in sections.items()
+                if path != root and not path.startswith(prefix)}
+        kept.update(fresh)
+        roots = [r for r in roots if r != root and not r.startswith(prefix)] + [root]
+        temp = self.path + '.tmp'
+        with open(temp, 'wb') as f:
+            f.write(b'\x03' + b'\0'.join(os.fsencode(r) for r in roots) + b'\n')
+            f.writelines(kept[path] for path in sorted(kept))
+        os.replace(temp, self.path)
+        return len(fresh), rescanned
+
+
+class IndexWalker(TreeWalker):
+    # TreeWalker for FindIndex.update: yields each directory's index section
+    # instead of its files, reusing the cached section when the directory's
+    # inode and mtime still match.
+    def __init__(self, cached, check=None):
+        super().__init__(hidden=True, stat_files=False, check=check)
+        self.cached = cached
+        # Directories changed in the last two seconds are stored with mtime
+        # 0, so a change later in the same mtime tick is picked up next time.
+        self.settled = time.time_ns() - 2 * 10**9
+
+    def scan(self, path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return path, None, None
+        section = self.cached.get(path)
+        if section is not None:
+            header, _, body = section.partition(b'\n')
+            if header.split(b'\t')[1:] == [b'%d' % st.st_ino, b'%d' % st.st_mtime_ns]:
+                dirs = [os.fsdecode(line[1:]) for line in body.split(b'\n') if line.startswith(b'\x02')]
+                return path, dirs, section
+        path, dirs, files = super().scan(path)
+        if dirs is None:
+            return path, None, None
+        # Names containing a newline cannot be stored one per line.
+        dirs = [name for name in dirs if '\n' not in name]
+        mtime = st.st_mtime_ns if st.st_mtime_ns < self.settled else 0
+        lines = [b'\x01%s\t%d\t%d' % (os.fsencode(path), st.st_ino, mtime)]
+        lines.extend(b'\x02' + os.fsencode(name) for name in dirs)
+        lines.extend(os.fsencode(name) for name, _ in files if '\n' not in name)
+        return path, dirs, b'\n'.join(lines) + b'\n'
+
+
+class InotifyWatcher:
+    # Minimal inotify binding (Linux, through ctypes) for "recent --watch":
+    # add() watches one folder, read() waits up to `timeout` seconds and
+    # returns (path, is_dir) for every file written, touched, created or
+    # moved into a watched folder.
+    IN_MODIFY = 0x2
+    IN_ATTRIB = 0x4
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+
+    def __init__(self):
+        import ctypes
+        import ctypes.util
+        self.ctypes = ctypes
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            error = ctypes.get_errno()
+            raise OSError(error, os.strerror(error))
+        self.folders = {}
+
+    def add(self, folder):
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(folder), self.MASK)
+        if wd < 0:
+            error = self.ctypes.get_errno()
+            raise OSError(error, os.strerror(error), folder)
+        self.folders[wd] = folder
+
+    def read(self, timeout):
+        import select
+        import struct
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return []
+        time.sleep(0.2)  # let a burst of writes arrive as one batch
+        events = []
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset + 16 <= len(data):
+                wd, mask, cookie, length = struct.unpack_from('iIII', data, offset)
+                name = data[offset + 16:offset + 16 + length].rstrip(b'\0')
+                offset += 16 + length
+                if mask & self.IN_IGNORED:
+                    self.folders.pop(wd, None)
+                elif name and wd in self.folders:
+                    events.append((os.path.join(self.folders[wd], os.fsdecode(name)), bool(mask & self.IN_ISDIR)))
+        return events
+
+    def close(self):
+        os.close(self.fd)
+
+
+GREP_MMAP_BYTES = 1024 * 1024
+GREP_PARALLEL_BYTES = 16 * 1024 * 1024
+
+
+def grep_files(paths, pattern, flags, mode, before, after, max_count):
+    # Searches a batch of files; runs in a worker process for big searches,
+    # so it is a module-level function. Returns [(path, result)] for the
+    # files that match, see grep_buffer. Files with a NUL byte in their first
+    # block are treated as binary and skipped; big files are memory-mapped
+    # instead of read.
+    import mmap
+    rx = re.compile(pattern, flags | re.M)
+    found = []
+    for path in paths:
+        try:
+            with open(path, 'rb') as f:
+                head = f.read(8192)
+                if b'\0' in head:
+                    continue
+                size = os.fstat(f.fileno()).st_size
+                if size <= len(head):
+                    result = grep_buffer(head, rx, mode, before, after, max_count)
+                elif size >= GREP_MMAP_BYTES:
+                    with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                        result = grep_buffer(data, rx, mode, before, after, max_count)
+                else:
+                    result = grep_buffer(head + f.read(), rx, mode, before, after, max_count)
+        except (OSError, ValueError):
+            continue
+        if result:
+            found.append((path, result))
+    return found
+
+
+def grep_buffer(data, rx, mode, before, after, max_count):
+    # mode 'files': True on the first match. 'count': number of matching
+    # lines. 'lines': [(line_no, ':' or '-', text)] with the match and
+    # context lines, and None between non-adjacent groups. Stops after
+    # max_count matching lines.
+    size = len(data)
+    count = 0
+    lines = []
+    line_no = 1
+    counted = 0
+    printed = 0
+    after_pos = 0
+    after_left = 0
+    pos = 0
+    while pos < size:
+        match = rx.search(data, pos)
+        if match is None:
+            break
+        if mode == 'files':
+            return True
+        count += 1
+        start = data.rfind(b'\n', 0, match.start()) + 1
+        end = data.find(b'\n', match.start())
+        if end < 0:
+            end = size
+        pos = end + 1
+        if mode == 'lines':
+            line_no += bytes(data[counted:start]).count(b'\n')
+            counted = start
+            while after_left and after_pos < start:
+                next_end = data.find(b'\n', after_pos)
+                printed += 1
+                lines.append((printed, '-', data[after_pos:next_end].rstrip(b'\r')))
+                after_pos = next_end + 1
+                after_left -= 1
+            context = []
+            line_start = start
+            for back in range(min(before, line_no - 1 - printed)):
+                line_end = line_start - 1
+                line_start = data.rfind(b'\n', 0, line_end) + 1
+                context.append((line_no - back - 1, '-', data[line_start:line_end].rstrip(b'\r')))
+            first = line_no - len(context)
+            if lines and (before or after) and first > printed + 1:
+                lines.append(None)
+            lines.extend(reversed(context))
+            lines.append((line_no, ':', data[start:end].rstrip(b'\r')))
+            printed = line_no
+            after_pos = pos
+            after_left = after
+        if max_count and count >= max_count:
+            break
+    while after_left and after_pos < size:
+        next_end = data.find(b'\n', after_pos)
+        if next_end < 0:
+            next_end = size
+        printed += 1
+        lines.append((printed, '-', data[after_pos:next_end].rstrip(b'\r')))
+        after_pos = next_end + 1
+        after_left -= 1
+    return lines if mode == 'lines' else count
+
+
+# Already-compressed formats are stored in backups as they are.
+STORED_EXTENSIONS = {
+    '.jpg', '.jpeg', '.png', '.gif', '.webp', '.heic', '.mp3', '.mp4', '.m4a', '.mkv', '.avi', '.mov',
+    '.webm', '.ogg', '.flac', '.zip', '.gz', '.tgz', '.bz2', '.xz', '.7z', '.rar', '.zst', '.jar',
+    '.apk', '.docx', '.xlsx', '.pptx', '.pdf',
+}
+BACKUP_CHUNK_BYTES = 8 * 1024 * 1024
+BACKUP_PARALLEL_BYTES = 32 * 1024 * 1024
+
+
+def compress_files(items, level):
+    # Worker for BackupWriter: items are (path, stored) pairs. Returns, per
+    # item, (crc, size, method, data) or an error message. Data that does
+    # not get smaller is stored.
+    import zlib
+    results = []
+    for path, stored in items:
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            results.append(str(e))
+            continue
+        crc = zlib.crc32(data)
+        if not stored:
+            compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+            packed = compressor.compress(data) + compressor.flush()
+            if len(packed) < len(data):
+                results.append((crc, len(data), zipfile.ZIP_DEFLATED, packed))
+                continue
+        results.append((crc, len(data), zipfile.ZIP_STORED, data))
+    return results
+
+
+def deflate_chunk(data, level, final):
+    # Worker for BackupWriter: raw deflate of one chunk of a big file. All
+    # but the last chunk end with a sync flush, so the chunks concatenate
+    # into one valid deflate stream.
+    import zlib
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class BackupWriter:
+    # Adds files to a ZipFile in the order given while a process pool (or
+    # the calling thread, when pool is None) compresses ahead of it: small
+    # files in batches, big files in BACKUP_CHUNK_BYTES chunks. At most two
+    # tasks per worker are in flight, which bounds memory. ZipFile has no
+    # public call for adding compressed data, so members are written the
+    # way ZipFile.writestr does it after compressing.
+    def __init__(self, zipf, source, level, pool=None, workers=1, check=None, progress=None):
+        self.zipf = zipf
+        self.source = source
+        self.level = level
+        self.pool = pool
+        self.limit = max(2, workers * 2)
+        self.check = check
+        self.progress = progress
+        self.window = []
+        self.batch = []
+        self.batch_bytes = 0
+        self.files = 0
+        self.bytes = 0
+        self.warnings = []
+
+    def submit(self, func, *args):
+        if self.pool is not None:
+            return self.pool.submit(func, *args)
+        from concurrent.futures import Future
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+    def push(self, future, handler, *args):
+        self.window.append((future, handler, args))
+        while len(self.window) > self.limit:
+            self.pop()
+
+    def pop(self):
+        future, handler, args = self.window.pop(0)
+        handler(future.result() if future is not None else None, *args)
+        if self.check:
+            self.check()
+
+    def add(self, path, st):
+        stored = self.level == 0 or os.path.splitext(path)[1].lower() in STORED_EXTENSIONS
+        if st.st_size < BACKUP_CHUNK_BYTES:
+            self.batch.append((path, st, stored))
+            self.batch_bytes += st.st_size
+            if self.batch_bytes >= 4 * 1024 * 1024 or len(self.batch) >= 64:
+                self.flush_batch()
+            return
+        self.flush_batch()
+        if stored:
+            self.push(None, self.write_stored, path, st)
+        else:
+            self.add_chunked(path, st)
+
+    def flush_batch(self):
+        if self.batch:
+            items = [(path, stored) for path, st, stored in self.batch]
+            self.push(self.submit(compress_files, items, self.level), self.write_batch, self.batch)
+            self.batch = []
+            self.batch_bytes = 0
+
+    def add_chunked(self, path, st):
+        import zlib
+        member = {'info': self.member_info(path, st), 'crc': 0, 'size': 0, 'expected': st.st_size}
+        try:
+            f = open(path, 'rb')
+        except OSError as e:
+            self.warnings.append(f"{path}: {e}")
+            return
+        self.push(None, self.write_header, member)
+        with f:
+            chunk = b""
+            try:
+                chunk = f.read(BACKUP_CHUNK_BYTES)
+                while True:
+                    following = f.read(BACKUP_CHUNK_BYTES) if chunk else b""
+                    member['crc'] = zlib.crc32(chunk, member['crc'])
+                    member['size'] += len(chunk)
+                    if member.get('stored'):
+                        self.push(None, self.write_chunk, member, chunk, not following)
+                    else:
+                        self.push(self.submit(deflate_chunk, chunk, self.level, not following), self.write_chunk,
+                                  member, chunk, not following)
+                    if not following:
+                        break
+                    chunk = following
+            except OSError as e:
+                # Close the member with what was read so the archive stays valid.
+                self.warnings.append(f"{path}: {e}")
+                self.push(self.submit(deflate_chunk, b"", self.level, True), self.write_chunk, member, b"", True)
+
+    def close(self):
+        self.flush_batch()
+        while self.window:
+            self.pop()
+
+    def member_info(self, path, st):
+        date_time = time.localtime(st.st_mtime)[:6]
+        if date_time[0] < 1980:
+            date_time = (1980, 1, 1, 0, 0, 0)
+        elif date_time[0] > 2107:
+            date_time = (2107, 12, 31, 23, 59, 59)
+        info = zipfile.ZipInfo(os.path.relpath(path, self.source), date_time)
+        info.external_attr = (st.st_mode & 0xFFFF) << 16
+        return info
+
+    def written(self, size):
+        self.files += 1
+        self.bytes += size
+        if self.progress and self.files % 100 == 0:
+            self.progress(self.files, self.bytes)
+
+    def write_batch(self, results, batch):
+        for (path, st, stored), result in zip(batch, results):
+            if isinstance(result, str):
+                self.warnings.append(f"{path}: {result}")
+                continue
+            crc, size, method, data = result
+            info = self.member_info(path, st)
+            info.compress_type = method
+            info.CRC = crc
+            info.file_size = size
+            info.compress_size = len(data)
+            self.start_member(info)
+            self.zipf.fp.write(info.FileHeader())
+            self.zipf.fp.write(data)
+            self.end_member(info)
+
+    def write_stored(self, result, path, st):
+        try:
+            self.zipf.write(path, os.path.relpath(path, self.source), zipfile.ZIP_STORED)
+        except OSError as e:
+            self.warnings.append(f"{path}: {e}")
+            return
+        self.written(st.st_size)
+
+    def write_header(self, result, member):
+        info = member['info']
+        info.compress_type = zipfile.ZIP_DEFLATED
+        info.file_size = member['expected']
+        info.compress_size = 0
+        info.CRC = 0
+        # Sizes are filled in after the last chunk; like ZipFile.open('w'),
+        # reserve zip64 fields when the file is anywhere near 4 GB.
+        member['zip64'] = info.file_size * 1.05 > zipfile.ZIP64_LIMIT
+        self.start_member(info)
+        self.zipf.fp.write(info.FileHeader(member['zip64']))
+
+    def write_chunk(self, data, member, chunk, final):
+        # Like compress_files, a member that does not shrink is stored: the
+        # first chunk decides, and later chunks are then written raw.
+        info = member['info']
+        if 'stored' not in member:
+            member['stored'] = len(data) >= len(chunk)
+        if member['stored']:
+            data = chunk
+        self.zipf.fp.write(data)
+        info.compress_size += len(data)
+        if not final:
+            return
+        info.CRC = member['crc']
+        info.file_size = member['size']
+        if member['stored']:
+            info.compress_type = zipfile.ZIP_STORED
+        if not member['zip64'] and max(info.file_size, info.compress_size) > zipfile.ZIP64_LIMIT:
+            raise RuntimeError(f"{info.filename} grew past 4 GB while it was being backed up")
+        end = self.zipf.fp.tell()
+        self.zipf.fp.seek(info.header_offset)
+        self.zipf.fp.write(info.FileHeader(member['zip64']))
+        self.zipf.fp.seek(end)
+        self.end_member(info)
+
+    def start_member(self, info):
+        self.zipf._writecheck(info)
+        self.zipf._didModify = True
+        info.header_offset = self.zipf.fp.tell()
+
+    def end_member(self, info):
+        self.zipf.filelist.append(info)
+        self.zipf.NameToInfo[info.filename] = info
+        self.zipf.start_dir = self.zipf.fp.tell()
+        self.written(info.file_size)
+
+
+STORE_CHUNK_BYTES = 4 * 1024 * 1024
+
+
+def store_file_chunks(items, chunk_dir, level):
+    # Worker for incremental backups: splits each file into chunks, writes
+    # the chunks the store does not have yet and returns, per item,
+    # (sha256, chunk ids, size, bytes written) or an error message.
+    import zlib
+    results = []
+    for path, stored in items:
+        file_hash = hashlib.sha256()
+        chunks = []
+        size = 0
+        written = 0
+        try:
+            with open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(STORE_CHUNK_BYTES)
+                    if not chunk:
+                        break
+                    digest = hashlib.sha256(chunk).hexdigest()
+                    file_hash.update(chunk)
+                    size += len(chunk)
+                    chunks.append(digest)
+                    target = os.path.join(chunk_dir, digest[:2], digest)
+                    if os.path.exists(target):
+                        continue
+                    packed = zlib.compress(chunk, level) if level and not stored else chunk
+                    payload = b'z' + packed if len(packed) < len(chunk) else b'r' + chunk
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    temp = f"{target}.{os.getpid()}.tmp"
+                    with open(temp, 'wb') as out:
+                        out.write(payload)
+                    os.replace(temp, target)
+                    written += len(payload)
+        except OSError as e:
+            results.append(str(e))
+            continue
+        results.append((file_hash.hexdigest(), chunks, size, written))
+    return results
+
+
+class ChunkStore:
+    # Content-addressed store for "backup --incremental". chunks/<ab>/<sha256>
+    # holds one chunk of up to STORE_CHUNK_BYTES ("z" + zlib data, or "r" +
+    # raw bytes); snapshots/<id>.json is one manifest per run listing each
+    # file's path, size, mtime_ns, sha256 and chunk ids. Identical chunks,
+    # and so identical files, are stored once.
+    def __init__(self, root):
+        self.root = root
+        self.chunk_dir = os.path.join(root, 'chunks')
+        self.snapshot_dir = os.path.join(root, 'snapshots')
+
+    def snapshot_ids(self):
+        try:
+            names = os.listdir(self.snapshot_dir)
+        except OSError:
+            return []
+        return sorted(name[:-5] for name in names if name.endswith('.json'))
+
+    def load(self, snapshot_id):
+        with open(os.path.join(self.snapshot_dir, snapshot_id + '.json'), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def save(self, manifest):
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        snapshot_id = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        path = os.path.join(self.snapshot_dir, snapshot_id + '.json')
+        suffix = 1
+        while os.path.exists(path):
+            suffix += 1
+            path = os.path.join(self.snapshot_dir, f"{snapshot_id}_{suffix}.json")
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(manifest, f, separators=(',', ':'))
+        os.replace(path + '.tmp', path)
+        return os.path.basename(path)[:-5]
+
+    def read_chunk(self, digest):
+        import zlib
+        with open(os.path.join(self.chunk_dir, digest[:2], digest), 'rb') as f:
+            payload = f.read()
+        return zlib.decompress(payload[1:]) if payload[:1] == b'z' else payload[1:]
+
+    def check_chunk(self, digest):
+        try:
+            return hashlib.sha256(self.read_chunk(digest)).hexdigest() == digest
+        except Exception:
+            # Missing files, truncated zlib data and the like.
+            return False
+
+
+COPY_SLICE_BYTES = 8 * 1024 * 1024
+
+
+HASH_ALGORITHMS = ('sha256', 'blake2b', 'md5', 'sha1', 'sha512', 'blake2s')
+
+
+def file_digest(path, algo='sha256'):
+    # hashlib releases the GIL while hashing, so threads can share the work.
+    with open(path, 'rb', buffering=0) as f:
+        if hasattr(hashlib, 'file_digest'):
+            return hashlib.file_digest(f, algo).hexdigest()
+        digest = hashlib.new(algo)
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+DUPES_EDGE_BYTES = 64 * 1024
+
+
+def edge_digest(path, size):
+    # Digest of the first and last DUPES_EDGE_BYTES of a file: a cheap first
+    # pass for dupes, and exact for files up to twice that size.
+    digest = hashlib.blake2b()
+    with open(path, 'rb', buffering=0) as f:
+        digest.update(f.read(DUPES_EDGE_BYTES))
+        if size > DUPES_EDGE_BYTES:
+            f.seek(max(DUPES_EDGE_BYTES, size - DUPES_EDGE_BYTES))
+            digest.update(f.read(DUPES_EDGE_BYTES))
+    return digest.hexdigest()
+
+
+class DigestCache(SqliteCache):
+    # On-disk cache of file digests (sqlite), keyed by absolute path and
+    # algorithm and valid while size, mtime_ns and inode still match. Files
+    # modified in the last 2 seconds are not cached, since they may change
+    # again within the same mtime tick.
+    table = "digests"
+
+    def connect(self):
+        import sqlite3
+        db = sqlite3.connect(self.path, timeout=5)
+        db.execute("CREATE TABLE IF NOT EXISTS digests (path TEXT, algo TEXT, size INTEGER, mtime INTEGER, "
+                   "ino INTEGER, digest TEXT, used REAL, PRIMARY KEY (path, algo))")
+        return db
+
+    def load(self, paths, algo):
+        # Returns {path: (size, mtime_ns, ino, digest)} for the paths that have a row.
+        import sqlite3
+        rows = {}
+        try:
+            db = self.connect()
+            try:
+                for start in range(0, len(paths), 500):
+                    batch = paths[start:start + 500]
+                    query = (f"SELECT path, size, mtime, ino, digest FROM digests "
+                             f"WHERE algo = ? AND path IN ({','.join('?' * len(batch))})")
+                    for row in db.execute(query, [algo] + batch):
+                        rows[row[0]] = row[1:]
+            finally:
+                db.close()
+        except (sqlite3.Error, UnicodeEncodeError):
+            return {}
+        return rows
+
+    def save(self, rows, algo):
+        # rows are (path, stat_result, digest).
+        import sqlite3
+        now = time.time()
+        settled = now - 2
+        try:
+            db = self.connect()
+            try:
+                with db:
+                    db.executemany("INSERT OR REPLACE INTO digests VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                   ((path, algo, st.st_size, st.st_mtime_ns, st.st_ino, digest, now)
+                                    for path, st, digest in rows
+                                    if st.st_mtime < settled and self.storable(path)))
+                self.evict(db)
+            finally:
+                db.close()
+        except (sqlite3.Error, OSError):
+            pass
+
+
+class FileCopier:
+    # Copies (source, target, lstat) jobs on a thread pool. Data moves with
+    # os.copy_file_range, else os.sendfile, else reads and writes, in
+    # COPY_SLICE_BYTES slices. Each file is written to <target>.part and
+    # renamed when complete; a .part left by an interrupted copy is resumed
+    # if its tail still matches the source. With skip='mtime' or 'hash',
+    # targets with the same size and mtime, or the same content, are kept.
+    def __init__(self, workers=None, skip=None, check=None, progress=None):
+        self.workers = workers or min(16, (os.cpu_count() or 1) * 4)
+        self.skip = skip
+        self.check = check
+        self.progress = progress
+        self.lock = threading.Lock()
+        self.stop = threading.Event()
+        self.last = time.perf_counter()
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+        self.resumed = 0
+        self.errors = []
+
+    def run(self, jobs):
+        pool = ThreadPoolExecutor(self.workers)
+        window = []
+        try:
+            for source, target, st in jobs:
+                window.append((source, pool.submit(self.copy, source, target, st)))
+                while len(window) > self.workers * 4:
+                    self.finish(*window.pop(0))
+            while window:
+                self.finish(*window.pop(0))
+        finally:
+            self.stop.set()
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    def finish(self, source, future):
+        from concurrent.futures import TimeoutError
+        while True:
+            try:
+                future.result(timeout=0.5)
+                break
+            except TimeoutError:
+                self.tick()
+            except OSError as e:
+                self.errors.append(f"{source}: {e}")
+                break
+        self.tick()
+
+    def tick(self):
+        if self.check:
+            self.check()
+        if self.progress and time.perf_counter() - self.last >= 1:
+            self.last = time.perf_counter()
+            self.progress(self.files, self.bytes)
+
+    def same(self, source, st, target):
+        try:
+            existing = os.stat(target)
+        except OSError:
+            return False
+        if existing.st_size != st.st_size:
+            return False
+        if self.skip == 'hash':
+            return file_digest(source) == file_digest(target)
+        return int(existing.st_mtime) == int(st.st_mtime)
+
+    def copy(self, source, target, st):
+        import shutil
+        import stat
+        if stat.S_ISLNK(st.st_mode):
+            if os.path.lexists(target):
+                os.remove(target)
+            os.symlink(os.readlink(source), target)
+            return
+        if self.skip and self.same(source, st, target):
+            with self.lock:
+                self.skipped += 1
+            return
+        part = target + '.part'
+        with open(source, 'rb', buffering=0) as src:
+            offset = self.resume_offset(src, part, st)
+            with open(part, 'r+b' if offset else 'wb', buffering=0) as dst:
+                if offset:
+                    dst.truncate(offset)
+                    with self.lock:
+                        self.resumed += 1
+                self.copy_range(src, dst, offset, st.st_size)
+        shutil.copystat(source, part)
+        os.replace(part, target)
+        with self.lock:
+            self.files += 1
+
+    def resume_offset(self, src, part, st):
+        # A .part newer than the source whose last 64 KB match the source at
+        # the same offset is taken as a valid prefix.
+        try:
+            done = os.stat(part)
+        except OSError:
+            return 0
+        if not 0 < done.st_size <= st.st_size or done.st_mtime < st.st_mtime:
+            return 0
+        tail = min(done.st_size, 64 * 1024)
+        with open(part, 'rb', buffering=0) as f:
+            f.seek(done.st_size - tail)
+            copied = f.read(tail)
+        src.seek(done.st_size - tail)
+        if src.read(tail) != copied:
+            return 0
+        return done.st_size
+
+    def copy_range(self, src, dst, offset, size):
+        import errno
+        unsupported = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP)
+        if hasattr(os, 'copy_file_range'):
+            method = 'range'
+        elif hasattr(os, 'sendfile') and sys.platform.startswith('linux'):
+            method = 'sendfile'
+        else:
+            method = 'read'
+        in_fd, out_fd = src.fileno(), dst.fileno()
+        while offset < size:
+            if self.stop.is_set():
+                raise JobCancelled()
+            count = min(COPY_SLICE_BYTES, size - offset)
+            if method == 'range':
+                try:
+                    sent = os.copy_file_range(in_fd, out_fd, count, offset, offset)
+                except OSError as e:
+                    if e.errno not in unsupported:
+                        raise
+                    method = 'sendfile' if hasattr(os, 'sendfile') and sys.platform.startswith('linux') else 'read'
+                    continue
+            elif method == 'sendfile':
+                try:
+                    os.lseek(out_fd, offset, os.SEEK_SET)
+                    sent = os.sendfile(out_fd, in_fd, offset, count)
+                except OSError as e:
+                    if e.errno not in unsupported:
+                        raise
+                    method = 'read'
+                    continue
+            else:
+                src.seek(offset)
+                data = memoryview(src.read(count))
+                dst.seek(offset)
+                sent = 0
+                while sent < len(data):
+                    sent += dst.write(data[sent:])
+            if not sent:
+                raise OSError(f"{src.name} shrank while it was being copied")
+            offset += sent
+            with self.lock:
+                self.bytes += sent
+
+
+DIFF_BLOCK_BYTES = 16 * 1024 * 1024
+DIFF_MAX_COST = 200
+
+
+def common_prefix(a, b, limit):
+    # Length of the common prefix of a[:limit] and b[:limit], compared a
+    # block at a time and bisected inside the first block that differs.
+    pos = 0
+    while pos < limit:
+        size = min(DIFF_BLOCK_BYTES // 16, limit - pos)
+        if a[pos:pos + size] == b[pos:pos + size]:
+            pos += size
+            continue
+        lo, hi = 0, size
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a[pos + lo:pos + mid] == b[pos + lo:pos + mid]:
+                lo = mid
+            else:
+                hi = mid
+        return pos + lo
+    return limit
+
+
+def common_suffix(a, b, limit):
+    end_a, end_b = len(a), len(b)
+    pos = 0
+    while pos < limit:
+        size = min(DIFF_BLOCK_BYTES // 16, limit - pos)
+        if a[end_a - pos - size:end_a - pos] == b[end_b - pos - size:end_b - pos]:
+            pos += size
+            continue
+        lo, hi = 0, size
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if a[end_a - pos - mid:end_a - pos - lo] == b[end_b - pos - mid:end_b - pos - lo]:
+                lo = mid
+            else:
+                hi = mid
+        return pos + lo
+    return limit
+
+
+class DiffInput:
+    # One side of a diff. The file is memory-mapped and only the lines
+    # between two line boundaries are indexed: ids holds a hash per line,
+    # starts the byte offset of each line plus a closing sentinel. base is
+    # the number of the first indexed line.
+    def __init__(self, path):
+        import mmap
+        self.file = open(path, 'rb')
+        size = os.fstat(self.file.fileno()).st_size
+        self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.base = 0
+        self.ids = array('q')
+        self.starts = array('q')
+        self.noeol = False
+
+    def close(self):
+        if not isinstance(self.data, bytes):
+            self.data.close()
+        self.file.close()
+
+    def index(self, start, end, ignore_space):
+        import operator
+        data = self.data
+        self.base = sum(data[pos:min(pos + DIFF_BLOCK_BYTES, start)].count(b'\n')
+                        for pos in range(0, start, DIFF_BLOCK_BYTES))
+        if start == end:
+            return
+        last = end - 1 if data[end - 1:end] == b'\n' else end
+        pos = start
+        while True:
+            stop = data.find(b'\n', min(pos + DIFF_BLOCK_BYTES, last), last)
+            if stop == -1:
+                stop = last
+            lines = data[pos:stop].split(b'\n')
+            self.ids.extend(map(hash, (b' '.join(line.split()) for line in lines) if ignore_space else lines))
+            offsets = map(operator.add, itertools.accumulate(map(len, lines), initial=pos), itertools.count())
+            self.starts.extend(itertools.islice(offsets, len(lines)))
+            if stop >= last:
+                break
+            pos = stop + 1
+        self.starts.append(last + 1)
+        if last == end == len(data):
+            # A last line without a newline differs from the same text with one.
+            self.noeol = True
+            self.ids[-1] = hash((self.ids[-1], 'noeol'))
+
+    def line(self, i):
+        return self.data[self.starts[i]:self.starts[i + 1] - 1]
+
+
+def index_diff(first, second, context, ignore_space):
+    # Indexes only what lies between the common prefix and suffix (on line
+    # boundaries, plus context lines). Returns False if the files are the same.
+    a, b = first.data, second.data
+    limit = min(len(a), len(b))
+    start = common_prefix(a, b, limit)
+    if start == len(a) == len(b):
+        return False
+    start = a.rfind(b'\n', 0, start) + 1
+    tail = common_suffix(a, b, limit - start)
+    end = len(a)
+    if tail:
+        newline = a.find(b'\n', len(a) - tail)
+        if newline != -1:
+            end = newline + 1
+    for _ in range(context):
+        if start == 0:
+            break
+        start = a.rfind(b'\n', 0, start - 1) + 1
+    for _ in range(context):
+        if end >= len(a):
+            break
+        newline = a.find(b'\n', end)
+        end = len(a) if newline == -1 else newline + 1
+    first.index(start, end, ignore_space)
+    second.index(start, len(b) - (len(a) - end), ignore_space)
+    return True
+
+
+def common_run(a, alo, ahi, b, blo, bhi):
+    # Number of equal items at the start of a[alo:ahi] and b[blo:bhi],
+    # found with doubling slice comparisons rather than item by item.
+    limit = min(ahi - alo, bhi - blo)
+    n = 0
+    step = 1
+    while n < limit:
+        k = min(step, limit - n)
+        if a[alo + n:alo + n + k] == b[blo + n:blo + n + k]:
+            n += k
+            step *= 2
+        elif k == 1:
+            break
+        else:
+            step = k // 2
+    return n
+
+
+def common_tail(a, alo, ahi, b, blo, bhi):
+    limit = min(ahi - alo, bhi - blo)
+    n = 0
+    step = 1
+    while n < limit:
+        k = min(step, limit - n)
+        if a[ahi - n - k:ahi - n] == b[bhi - n - k:bhi - n]:
+            n += k
+            step *= 2
+        elif k == 1:
+            break
+        else:
+            step = k // 2
+    return n
+
+
+def longest_increasing(js):
+    # Indexes of the longest increasing subsequence of js (patience sorting).
+    import operator
+    if all(map(operator.lt, js, js[1:])):
+        return range(len(js))
+    tails = []
+    tail_index = []
+    back = [-1] * len(js)
+    for k, j in enumerate(js):
+        pos = bisect.bisect_left(tails, j)
+        if pos:
+            back[k] = tail_index[pos - 1]
+        if pos == len(tails):
+            tails.append(j)
+            tail_index.append(k)
+        else:
+            tails[pos] = j
+            tail_index[pos] = k
+    result = []
+    k = tail_index[-1]
+    while k >= 0:
+        result.append(k)
+        k = back[k]
+    return result[::-1]
+
+
+def diff_matches(a, alo, ahi, b, blo, bhi):
+    # Yields matching blocks (i, j, size) in order. Lines that occur once
+    # on each side are anchors (patience diff): the longest run of anchors
+    # in the same order splits the problem, and regions without any go to
+    # myers_matches. Set operations, map and compress keep the per-line
+    # work out of the interpreter loop where they can.
+    import operator
+    from collections import Counter
+    n = common_run(a, alo, ahi, b, blo, bhi)
+    if n:
+        yield alo, blo, n
+        alo += n
+        blo += n
+    t = common_tail(a, alo, ahi, b, blo, bhi)
+    ahi -= t
+    bhi -= t
+    if alo < ahi and blo < bhi:
+        slice_a, slice_b = a[alo:ahi], b[blo:bhi]
+        set_a, set_b = set(slice_a), set(slice_b)
+        unique = common = set_a & set_b
+        for values, distinct in ((slice_a, set_a), (slice_b, set_b)):
+            if common and len(distinct) < len(values):
+                counts = Counter(values)
+                unique = unique - set(itertools.compress(counts, map((1).__lt__, counts.values())))
+        if unique:
+            # Duplicate values keep their last position but are never looked up.
+            where = dict(zip(slice_b, range(blo, bhi)))
+            mask = list(map(unique.__contains__, slice_a))
+            anchors_a = list(itertools.compress(range(alo, ahi), mask))
+            anchors_b = list(map(where.__getitem__, itertools.compress(slice_a, mask)))
+            keep = longest_increasing(anchors_b)
+            if len(keep) < len(anchors_b):
+                anchors_a = [anchors_a[k] for k in keep]
+                anchors_b = [anchors_b[k] for k in keep]
+            # Anchors next to each other on both sides form one matching block.
+            breaks = map(operator.ne, map(operator.add, map(operator.sub, anchors_a[1:], anchors_a),
+                                          map(operator.sub, anchors_b[1:], anchors_b)), itertools.repeat(2))
+            starts = [0, *itertools.compress(range(1, len(anchors_a)), breaks), len(anchors_a)]
+            i0, j0 = alo, blo
+            for first, stop in zip(starts, starts[1:]):
+                i, j = anchors_a[first], anchors_b[first]
+                if i > i0 and j > j0:
+                    yield from diff_matches(a, i0, i, b, j0, j)
+                yield i, j, stop - first
+                i0, j0 = i + stop - first, j + stop - first
+            yield from diff_matches(a, i0, ahi, b, j0, bhi)
+        elif common:
+            yield from myers_matches(a, alo, ahi, b, blo, bhi)
+    if t:
+        yield ahi, bhi, t
+
+
+def myers_matches(a, alo, ahi, b, blo, bhi):
+    # Linear-space Myers: split at the middle snake and recurse on both halves.
+    n = common_run(a, alo, ahi, b, blo, bhi)
+    if n:
+        yield alo, blo, n
+        alo += n
+        blo += n
+    t = common_tail(a, alo, ahi, b, blo, bhi)
+    ahi -= t
+    bhi -= t
+    if alo < ahi and blo < bhi:
+        x, y = middle_snake(a, alo, ahi, b, blo, bhi)
+        yield from myers_matches(a, alo, x, b, blo, y)
+        yield from myers_matches(a, x, ahi, b, y, bhi)
+    if t:
+        yield ahi, bhi, t
+
+
+def middle_snake(a, alo, ahi, b, blo, bhi):
+    # Searches forward from the top-left and backward from the bottom-right
+    # until the paths overlap. After DIFF_MAX_COST rounds it settles, like
+    # GNU diff, for the furthest point either search reached: the diff may
+    # then not be minimal, but time stays bounded on very different inputs.
+    dmin, dmax = alo - bhi, ahi - blo
+    fmid, bmid = alo - blo, ahi - bhi
+    odd = (fmid - bmid) & 1
+    fd = {fmid: alo}
+    bd = {bmid: ahi}
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    cost = 0
+    while True:
+        cost += 1
+        if fmin > dmin:
+            fmin -= 1
+            fd[fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            fd[fmax + 1] = -1
+        else:
+            fmax -= 1
+        for d in range(fmax, fmin - 1, -2):
+            low, high = fd[d - 1], fd[d + 1]
+            x = high if low < high else low + 1
+            y = x - d
+            while x < ahi and y < bhi and a[x] == b[y]:
+                x += 1
+                y += 1
+            fd[d] = x
+            if odd and bmin <= d <= bmax and bd[d] <= x:
+                return x, y
+        if bmin > dmin:
+            bmin -= 1
+            bd[bmin - 1] = sys.maxsize
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            bd[bmax + 1] = sys.maxsize
+        else:
+            bmax -= 1
+        for d in range(bmax, bmin - 1, -2):
+            low, high = bd[d - 1], bd[d + 1]
+            x = low if low < high else high - 1
+            y = x - d
+            while x > alo and y > blo and a[x - 1] == b[y - 1]:
+                x -= 1
+                y -= 1
+            bd[d] = x
+            if not odd and fmin <= d <= fmax and x <= fd[d]:
+                return x, y
+        if cost >= DIFF_MAX_COST:
+            forward, fx = -1, alo
+            for d in range(fmax, fmin - 1, -2):
+                x = min(fd[d], ahi)
+                y = x - d
+                if y > bhi:
+                    x, y = bhi + d, bhi
+                if x + y > forward:
+                    forward, fx = x + y, x
+            backward, bx = sys.maxsize, ahi
+            for d in range(bmax, bmin - 1, -2):
+                x = max(alo, bd[d])
+                y = x - d
+                if y < blo:
+                    x, y = blo + d, blo
+                if x + y < backward:
+                    backward, bx = x + y, x
+            if (ahi + bhi) - backward < forward - (alo + blo):
+                return fx, forward - fx
+            return bx, backward - bx
+
+
+def diff_hunks(blocks, n, m, context):
+    # Groups the changes between matching blocks into hunks of
+    # (i1, i2, j1, j2) changes, yielding each hunk as soon as the next
+    # change is too far away to share its context.
+    hunk = []
+    i0 = j0 = 0
+    for i, j, size in itertools.chain(blocks, [(n, m, 0)]):
+        if i > i0 or j > j0:
+            if hunk and i0 - hunk[-1][1] > 2 * context:
+                yield hunk
+                hunk = []
+            hunk.append((i0, i, j0, j))
+        i0, j0 = i + size, j + size
+    if hunk:
+        yield hunk
+
+
+class Output:
+    # Central stdout handling. When stdout is a pipe or file, install() swaps
+    # the stream for one with a 64 KB buffer, so printing thousands of rows
+    # costs a handful of writes; the shell flushes after every command and
+    # input() flushes before each prompt. A terminal stays line-buffered so
+    # streamed results show up as they are found. Commands that animate, clear the screen or
+    # wait on the network flush their own progress. paged() captures a command's output and
+    # hands it to a pager when it is longer than the terminal.
+    def __init__(self):
+        self.pager = False
+
+    def install(self, buffer_size=1 << 16):
+        stream = sys.stdout
+        try:
+            if stream.isatty():
+                return
+            raw = io.FileIO(stream.fileno(), 'w', closefd=False)
+        except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+            return
+        stream.flush()
+        sys.stdout = io.TextIOWrapper(io.BufferedWriter(raw, buffer_size), encoding=stream.encoding,
+                                      errors=stream.errors, line_buffering=False)
+
+    def color_enabled(self, no_color=False):
+        if no_color or 'NO_COLOR' in os.environ:
+            return False
+        return sys.stdout.isatty()
+
+    def paged(self, func):
+        # Only this thread's output is captured; background jobs keep
+        # writing to their own buffers.
+        if not isinstance(sys.stdout, JobOutput):
+            sys.stdout = JobOutput(sys.stdout)
+        previous = getattr(thread_state, 'sink', None)
+        buffer = io.StringIO()
+        thread_state.sink = buffer
+        try:
+            return func()
+        finally:
+            thread_state.sink = previous
+            self.page(buffer.getvalue())
+
+    def page(self, text):
+        import shutil
+        rows = shutil.get_terminal_size().lines
+        if not sys.stdout.isatty() or text.count("\n") < rows - 1:
+            sys.stdout.write(text)
+            sys.stdout.flush()
+            return
+        pager = os.environ.get('PAGER') or ('more' if os.name == 'nt' else 'less -R')
+        sys.stdout.flush()
+        try:
+            subprocess.run(pager, shell=True, input=text.encode(sys.stdout.encoding or 'utf-8', 'replace'))
+        except (OSError, subprocess.SubprocessError):
+            sys.stdout.write(text)
+            sys.stdout.flush()
+
+
+class NoColor:
+    # Stands in for colorama's Fore/Back/Style with every code set to "", so
+    # plain output builds the same f-strings without any escape sequences.
+    def __init__(self, codes=None):
+        for name in dir(codes):
+            if not name.startswith('_'):
+                setattr(self, name, "")
+
+    def __getattr__(self, name):
+        return ""
+
+
+def setup_colors(enabled):
+    global Fore, Back, Style
+    if enabled:
+        colorama.init()
+    else:
+        Fore, Back, Style = NoColor(Fore), NoColor(Back), NoColor(Style)
+
+# Pre-rendered pyfiglet "slant" output, so the banner needs no font loading.
+BANNER = r"""
+    ___       __                                __   ________  _______
+   /   | ____/ /   ______ _____  ________  ____/ /  / ____/  |/  / __ \
+  / /| |/ __  / | / / __ `/ __ \/ ___/ _ \/ __  /  / /   / /|_/ / / / /
+ / ___ / /_/ /| |/ / /_/ / / / / /__/  __/ /_/ /  / /___/ /  / / /_/ /
+/_/  |_\__,_/ |___/\__,_/_/ /_/\___/\___/\__,_/   \____/_/  /_/_____/
+"""
+
+CATEGORIES = ["System Commands", "System Info", "Network Tools", "Utilities & Tools",
+              "Fun & Games", "Advanced", "System Management"]
+
+# Command registry: name -> Command. Built-in commands are added by the
+# @command decorator when the class body runs, third-party commands by
+# register_command() with a "module:function" target that is only imported
+# the first time the command is used.
+COMMANDS = {}
+
+
+class UsageError(Exception):
+    pass
+
+
+class Command:
+    def __init__(self, name, category, usage="", description="", handler=None, target=None,
+                 min_args=0, options=None, network=False, uses_psutil=False, blocking=False,
+                 interactive=False, options_first=False):
+        self.name = name
+        self.category = category
+        self.usage = usage
+        self.description = description
+        self.handler = handler
+        self.target = target
+        self.min_args = min_args
+        self.options = options
+        self.network = network
+        self.uses_psutil = uses_psutil
+        self.blocking = blocking
+        self.interactive = interactive
+        self.options_first = options_first
+        self.records = None
+
+    def resolve(self):
+        if self.handler is None:
+            import importlib
+            module_name, _, attr = self.target.partition(":")
+            self.handler = getattr(importlib.import_module(module_name), attr)
+        return self.handler
+
+    def parse(self, args):
+        if self.options is None:
+            positional, opts = args, None
+        else:
+            positional, opts = parse_options(args, self.options, self.options_first)
+        if len(positional) < self.min_args:
+            raise UsageError()
+        return positional, opts
+
+
+def parse_options(args, options, options_first=False):
+    # options maps "--flag" to bool (switch) or a converter such as int/str;
+    # a value starting with "-" makes the key an alias, e.g. {"-r": "--reverse"}.
+    # With options_first, the first positional argument ends option parsing.
+    opts = {}
+    for flag, kind in options.items():
+        if not (isinstance(kind, str) and kind.startswith("-")):
+            opts[flag.lstrip("-").replace("-", "_")] = False if kind is bool else None
+    positional = []
+    args = iter(args)
+    for arg in args:
+        if arg == "--":
+            positional.extend(args)
+            break
+        flag, eq, value = arg.partition("=")
+        if options_first and not flag.startswith("-"):
+            positional.append(arg)
+            positional.extend(args)
+            break
+        if not flag.startswith("-") or flag not in options:
+            if flag.startswith("-") and len(flag) > 1 and not flag[1:2].isdigit():
+                raise UsageError(f"unknown option {flag}")
+            positional.append(arg)
+            continue
+        kind = options[flag]
+        if isinstance(kind, str) and kind.startswith("-"):
+            flag, kind = kind, options[kind]
+        key = flag.lstrip("-").replace("-", "_")
+        if kind is bool:
+            opts[key] = True
+            continue
+        if not eq:
+            value = next(args, None)
+            if value is None:
+                raise UsageError(f"option {flag} needs a value")
+        try:
+            opts[key] = kind(value)
+        except ValueError:
+            raise UsageError(f"invalid value for {flag}: {value}")
+    return positional, opts
+
+
+def register_command(name, category, usage="", description="", handler=None, target=None, **meta):
+    # Handlers are called as handler(shell, args), or handler(shell, args, opts)
+    # when the command declares options.
+    COMMANDS[name] = Command(name, category, usage, description, handler=handler, target=target, **meta)
+    if category not in CATEGORIES:
+        CATEGORIES.append(category)
+    return COMMANDS[name]
+
+
+def command(name, category, usage="", description="", **meta):
+    def decorate(func):
+        register_command(name, category, usage, description, handler=func, **meta)
+        return func
+    return decorate
+
+
+def records(name):
+    # Marks a generator method as the record source of command `name`, which
+    # makes the command usable as the first stage of a `|` pipeline.
+    def decorate(func):
+        COMMANDS[name].records = func
+        return func
+    return decorate
+
+#PIPELINES:
+
+# Pipeline stages: name -> Command whose handler takes (records, args) and
+# returns a new iterator. Stages never materialise their input unless they
+# have to (sort), so `find x | head 10` stops the walk after ten matches.
+STAGES = {}
+
+
+def stage(name, usage="", description=""):
+    def decorate(func):
+        STAGES[name] = Command(name, "Pipelines", usage, description, handler=func)
+        return func
+    return decorate
+
+
+def parse_size(value):
+    units = {'KB': 1024, 'MB': 1024 ** 2, 'GB': 1024 ** 3, 'TB': 1024 ** 4, 'B': 1}
+    text = value.strip().upper()
+    for unit, factor in units.items():
+        if text.endswith(unit) and text[:-len(unit)].strip():
+            return float(text[:-len(unit)]) * factor
+    return float(text)
+
+
+FILTER_OPS = [('>=', lambda a, b: a >= b), ('<=', lambda a, b: a <= b), ('!=', lambda a, b: a != b),
+              ('==', lambda a, b: a == b), ('=', lambda a, b: a == b), ('>', lambda a, b: a > b),
+              ('<', lambda a, b: a < b), ('~', lambda a, b: str(b).lower() in str(a).lower())]
+
+
+def compile_condition(text):
+    for symbol, op in FILTER_OPS:
+        field, found, value = text.partition(symbol)
+        if found and field:
+            break
+    else:
+        needle = text.lower()
+        return lambda record: any(needle in str(v).lower() for v in record.values())
+
+    def test(record):
+        actual = record.get(field)
+        if actual is None:
+            return False
+        expected = value
+        if isinstance(actual, (int, float)) and symbol != '~':
+            try:
+                expected = parse_size(value)
+            except ValueError:
+                return False
+        return op(actual, expected)
+    return test
+
+
+def sort_key(field):
+    def key(record):
+        value = record.get(field)
+        return (value is None, value if value is not None else 0)
+    return key
+
+
+@stage("filter", "<field><op><value>... | <text>", "keep records matching all conditions (ops: = != > < >= <= ~)")
+def stage_filter(records, args):
+    if not args:
+        raise UsageError("filter needs a condition")
+    tests = [compile_condition(arg) for arg in args]
+    return (record for record in records if all(test(record) for test in tests))
+
+
+@stage("sort", "<field> [-r]", "sort records by a field (-r for descending)")
+def stage_sort(records, args, limit=None):
+    fields = [arg for arg in args if arg != '-r']
+    if len(fields) != 1:
+        raise UsageError("sort needs one field name")
+    reverse = len(fields) != len(args)
+    key = sort_key(fields[0])
+    if limit is not None:
+        # `sort ... | head n` only needs the top n, so keep a bounded heap.
+        return iter((heapq.nlargest if reverse else heapq.nsmallest)(limit, records, key=key))
+    return iter(sorted(records, key=key, reverse=reverse))
+
+
+@stage("head", "[n]", "keep only the first n records (default 10)")
+def stage_head(records, args):
+    return itertools.islice(records, stage_count(args))
+
+
+def stage_count(args):
+    try:
+        return max(0, int(args[0])) if args else 10
+    except ValueError:
+        raise UsageError(f"invalid count: {args[0]}")
+
+
+@stage("count", "", "count the records")
+def stage_count_records(records, args):
+    return iter([{'count': sum(1 for _ in records)}])
+
+
+@stage("select", "<field>[,<field>...]", "keep only the given fields")
+def stage_select(records, args):
+    fields = [field for arg in args for field in arg.split(',') if field]
+    if not fields:
+        raise UsageError("select needs at least one field")
+    return ({field: record.get(field) for field in fields} for record in records)
+
+
 class AdvancedCMD:
-    def __init__(self):
-        self.history = deque(maxlen=100)
+    def __init__(self, output=None):
+        self.output = output or Output()
+        self.history_file = os.environ.get('ADVANCEDCMD_HISTORY') or os.path.join(os.path.expanduser('~'), '.advancedcmd_history')
+        self.history = History(self.history_file)
+        self.du_cache_file = os.environ.get('ADVANCEDCMD_DU_CACHE') or os.path.join(os.path.expanduser('~'), '.advancedcmd_du.db')
+        self.find_index_file = os.environ.get('ADVANCEDCMD_FIND_INDEX') or os.path.join(os.path.expanduser('~'), '.advancedcmd_find.idx')
+        self.digest_cache_file = os.environ.get('ADVANCEDCMD_DIGEST_CACHE') or os.path.join(os.path.expanduser('~'), '.advancedcmd_digests.db')
         self.current_dir = os.getcwd()
         self.notes_file = "notes.txt"
         self.todo_file = "todo.json"
         self.agenda_file = "agenda.json"
+        self.plugins_file = "plugins.json"
         self.running = True
+        self.interactive = False
+        self.local = threading.local()
+        self.latency = {}
+        self.cpu = CpuSampler()
+        self.jobs = {}
+        self.next_job_id = 1
+        self.max_jobs = 4
+        self.job_pool = None
         self.load_todo_list()
         self.load_agenda()
+        self.load_plugins()
         
     def load_todo_list(self):
         try:
@@ -67,15 +2121,38 @@ class AdvancedCMD:
     def save_agenda(self):
         with open(self.agenda_file, 'w') as f:
             json.dump(self.agenda, f, indent=2)
+
+    def load_plugins(self):
+        # plugins.json: [{"name": ..., "target": "module:function", "category": ..., ...}]
+        try:
+            with open(self.plugins_file, 'r') as f:
+                plugins = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return
+        for plugin in plugins:
+            try:
+                plugin = dict(plugin)
+                register_command(plugin.pop('name'), plugin.pop('category', 'Plugins'), **plugin)
+            except (KeyError, TypeError) as e:
+                self.print_error(f"Invalid plugin entry in {self.plugins_file}: {e}")
     
     def print_banner(self):
-        banner = pyfiglet.figlet_format("Advanced CMD", font="slant")
-        print(f"{Fore.CYAN}{banner}{Style.RESET_ALL}")
+        print(f"{Fore.CYAN}{BANNER}{Style.RESET_ALL}")
         print(f"{Fore.GREEN}Welcome to Advanced CMD{Style.RESET_ALL}")
         print(f"{Fore.YELLOW}Type 'help' for available commands or 'exit' to quit{Style.RESET_ALL}")
         print()
     
+    @property
+    def error_count(self):
+        return getattr(self.local, 'errors', 0)
+
+    def check_cancelled(self):
+        job = getattr(thread_state, 'job', None)
+        if job is not None and job.cancel_event.is_set():
+            raise JobCancelled()
+
     def print_error(self, message):
+        self.local.errors = self.error_count + 1
         print(f"{Fore.RED}Error: {message}{Style.RESET_ALL}")
     
     def print_success(self, message):
@@ -87,84 +2164,183 @@ class AdvancedCMD:
     def print_warning(self, message):
         print(f"{Fore.YELLOW}{message}{Style.RESET_ALL}")
     
+    def confirm(self, prompt):
+        # Scripts, -c one-liners and background jobs never block on a question;
+        # they take the default (No).
+        if not self.interactive or getattr(thread_state, 'job', None) is not None:
+            return False
+        return input(prompt).lower() == 'y'
+
+    def clear_screen(self):
+        # Anything still in the stdout buffer must land before the clear.
+        sys.stdout.flush()
+        os.system('cls' if os.name == 'nt' else 'clear')
+
     def get_prompt(self):
         return f"{Fore.MAGENTA}Advanced CMD{Fore.CYAN} > {Style.RESET_ALL}"
     
-    def execute_system_command(self, command):
-        try:
-            result = subprocess.run(command, shell=True, capture_output=True, text=True)
-            if result.stdout:
-                print(result.stdout)
-            if result.stderr:
-                self.print_error(result.stderr)
-            return result.returncode == 0
+    def execute_system_command(self, command, timeout=None, tee=None):
+        # Returns the exit status; 124 means the timeout expired.
+        shell = isinstance(command, str)
+        in_job = getattr(thread_state, 'job', None) is not None
+        sys.stdout.flush()
+        try:
+            if tee is None and not in_job and self.interactive and sys.stdout.isatty():
+                # Let interactive programs talk to the terminal directly.
+                if not timeout:
+                    return subprocess.run(command, shell=shell).returncode
+                proc = subprocess.Popen(command, shell=shell, **self.process_group())
+                try:
+                    return proc.wait(timeout)
+                except BaseException:
+                    self.kill_process_group(proc)
+                    proc.wait()
+                    raise
+            return self.stream_system_command(command, shell, timeout, tee, in_job)
+        except subprocess.TimeoutExpired:
+            self.print_error(f"Command timed out after {timeout:g} seconds")
+            return 124
         except Exception as e:
             self.print_error(f"Failed to execute command: {e}")
-            return False
+            return 1
+
+    def process_group(self):
+        # The child gets its own process group, so a timeout or cancel also
+        # kills whatever the shell started and nothing keeps a pipe open.
+        if os.name == 'nt':
+            return {'creationflags': subprocess.CREATE_NEW_PROCESS_GROUP}
+        return {'start_new_session': True}
+
+    def kill_process_group(self, proc):
+        if os.name == 'nt':
+            subprocess.run(f"taskkill /F /T /PID {proc.pid}", shell=True,
+                           stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        else:
+            import signal
+            try:
+                os.killpg(proc.pid, signal.SIGKILL)
+            except OSError:
+                pass
+        proc.kill()
+
+    def stream_system_command(self, command, shell, timeout, tee, in_job):
+        # Copies the child's output (stderr merged into stdout) in 64 KB chunks,
+        # so memory use stays flat however much the command prints.
+        import codecs
+        import locale
+        decoder = codecs.getincrementaldecoder(locale.getpreferredencoding(False))(errors='replace')
+        stdin = None if self.interactive and not in_job else subprocess.DEVNULL
+        proc = subprocess.Popen(command, shell=shell, stdin=stdin, stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT, bufsize=0, **self.process_group())
+        timed_out = threading.Event()
+
+        def expire():
+            timed_out.set()
+            self.kill_process_group(proc)
+
+        timer = threading.Timer(timeout, expire) if timeout else None
+        tee_file = open(tee, 'ab') if tee else None
+        try:
+            if timer:
+                timer.start()
+            while True:
+                chunk = proc.stdout.read(65536)
+                if not chunk:
+                    break
+                if tee_file:
+                    tee_file.write(chunk)
+                sys.stdout.write(decoder.decode(chunk))
+                sys.stdout.flush()
+                self.check_cancelled()
+            sys.stdout.write(decoder.decode(b'', final=True))
+            status = proc.wait()
+        except BaseException:
+            self.kill_process_group(proc)
+            proc.wait()
+            raise
+        finally:
+            if timer:
+                timer.cancel()
+            if tee_file:
+                tee_file.close()
+            proc.stdout.close()
+        if timed_out.is_set():
+            self.print_error(f"Command timed out after {timeout:g} seconds")
+            return 124
+        return status
     
+    @command("help", "System Commands", "[command]", "show available commands or details for one command")
     def cmd_help(self, args):
-        commands = {
-            "System Commands": [
-                "'dir' - list directory contents",
-                "'cd' - change directory", 
-                "'cls' - clear screen", 
-                "'copy' - copy file from source to destination", 
-                "'move' - move/rename file", 
-                "'del' - delete file", 
-                "'exit' - quit Advanced CMD"],
-            "System Info": [
-                "'sysinfo' - display comprehensive system information (CPU, RAM, OS)", 
-                "'netinfo' - show network interfaces, IP addresses, subnet masks", 
-                "'ps' - list all running processes with PID, CPU and memory usage", 
-                "'diskinfo' - display disk usage for all drives and partitions", 
-                "'uptime' - show system boot time and uptime duration", 
-                "'temp' - show CPU and GPU temperatures in real-time", 
-                "'whoami_plus' - extended user info with groups and permissions"],
-            "Network Tools": [
-                "'ping' [host] - send ICMP ping packets to host", 
-                "'ports' - scan and list all open local network ports", 
-                "'http' [url] - fetch HTTP headers and status code from URL", 
-                "'whois' [domain] - perform WHOIS lookup for domain information", 
-                "'geoip' [IP] - get geolocation info for IP address (country, city, ISP)", 
-                "'mailcheck' [email] - verify if email address exists using MX lookup", 
-                "'nettest' - perform internet speed test (download, upload, ping)"],
-            "Utilities & Tools": [
-                "'calc' [expression] - evaluate mathematical expression (e.g. calc 2+2*3)", 
-                "'timer' [seconds] - countdown timer with beep sound at end", 
-                "'note' [text] - append timestamped text to notes.txt file", 
-                "'todo' - task manager - add, list, mark done, remove tasks", 
-                "'find' [file name] - searches for a file by its name", 
-                "'recent' - show recently accessed/modified files", 
-                "'tree' - display directory structure as tree", 
-                "'du' [folder] - show disk usage and size of folder", 
-                "'backup' [source] [dest] - create compressed backup of folder", 
-                "'diff' [file1] [file2] - compare two files and show differences",
-                "'weather' [city] - fetch current weather information for city"],
-            "Fun & Games": [
-                "'ascii' [text] - generate ASCII art from input text",
-                "'asciiart' [image.jpg] - convert image file to ASCII art representation",  
-                "'matrix' - display falling green Matrix-style text effect", 
-                "'snake' - play classic Snake game in console", 
-                "'rps' [choice] - play Rock-Paper-Scissors (rock/paper/scissors)", 
-                "'mindmap' [topic] - generate simple ASCII mind map structure"],
-            "Advanced": [
-                "'encrypt' [file] - encrypt file with password protection", 
-                "'decrypt' [file] - decrypt encrypted file with password", 
-                "'pwgen' [length]/[nosymbols] - generate secure random password", 
-                "'translate' [text] [lang] - translate text to specified language", 
-                "'agenda' - calendar and appointment manager"],
-            "System Management": [
-                "'kill' [PID] - terminate process by Process ID", 
-                "'syslog' - display system logs and recent events"]
-        }
-        
+        if args:
+            spec = COMMANDS.get(args[0].lower())
+            if spec is None:
+                self.print_error(f"Unknown command: {args[0]}")
+                return
+            print(f"{Fore.CYAN}{spec.name}{Style.RESET_ALL} - {spec.description}")
+            print(f"  Usage: {spec.name} {spec.usage}".rstrip())
+            if spec.options:
+                print(f"  Options: {' '.join(spec.options)}")
+            needs = [label for label, flag in (("network", spec.network), ("psutil", spec.uses_psutil),
+                                               ("blocking I/O", spec.blocking),
+                                               ("interactive terminal", spec.interactive)) if flag]
+            if needs:
+                print(f"  Needs: {', '.join(needs)}")
+            return
+
         print(f"{Fore.CYAN}Advanced CMD - Available Commands:{Style.RESET_ALL}\n")
-        for category, cmds in commands.items():
+        for category in CATEGORIES:
+            specs = [spec for spec in COMMANDS.values() if spec.category == category]
+            if not specs:
+                continue
             print(f"{Fore.GREEN}{category}:{Style.RESET_ALL}")
-            for cmd in cmds:
-                print(f"  {Fore.YELLOW}{cmd}{Style.RESET_ALL}")
+            for spec in specs:
+                usage = f" {spec.usage}" if spec.usage else ""
+                print(f"  {Fore.YELLOW}'{spec.name}'{usage} - {spec.description}{Style.RESET_ALL}")
             print()
+
+        sources = ", ".join(f"'{spec.name}'" for spec in COMMANDS.values() if spec.records)
+        print(f"{Fore.GREEN}Pipelines ({sources} | stage | ...):{Style.RESET_ALL}")
+        for spec in STAGES.values():
+            usage = f" {spec.usage}" if spec.usage else ""
+            print(f"  {Fore.YELLOW}'{spec.name}'{usage} - {spec.description}{Style.RESET_ALL}")
+        print()
     
+    def format_field(self, field, value):
+        if value is None:
+            return ""
+        if field == 'size' and isinstance(value, (int, float)):
+            return self.format_bytes(value)
+        if field == 'mtime' and isinstance(value, (int, float)):
+            return datetime.datetime.fromtimestamp(value).strftime("%Y-%m-%d %H:%M")
+        if isinstance(value, float):
+            return f"{value:.1f}"
+        return str(value)
+
+    def print_records(self, records):
+        # Column widths come from the first 50 records; the rest are streamed.
+        records = iter(records)
+        head = list(itertools.islice(records, 50))
+        if not head:
+            print(f"{Fore.YELLOW}No records{Style.RESET_ALL}")
+            return
+        fields = list(head[0])
+        if len(fields) == 1:
+            field = fields[0]
+            for record in itertools.chain(head, records):
+                print(self.format_field(field, record.get(field)))
+            return
+
+        def row(record):
+            return [(self.format_field(f, record.get(f)), isinstance(record.get(f), (int, float))) for f in fields]
+
+        rows = [row(record) for record in head]
+        widths = [max(len(field), *(len(r[i][0]) for r in rows)) for i, field in enumerate(fields)]
+        print(f"{Fore.CYAN}{'  '.join(f.ljust(w) for f, w in zip(fields, widths)).rstrip()}{Style.RESET_ALL}")
+        print("-" * (sum(widths) + 2 * (len(widths) - 1)))
+        for cells in itertools.chain(rows, map(row, records)):
+            print("  ".join(text.rjust(w) if numeric else text.ljust(w)
+                            for (text, numeric), w in zip(cells, widths)).rstrip())
+
     def format_bytes(self, bytes_count):
         if bytes_count == 0:
             return "0 B"
@@ -174,33 +2350,124 @@ class AdvancedCMD:
             bytes_count /= 1024
         return f"{bytes_count:.1f} PB"
 
-    def cmd_dir(self, args):
-        path = args[0] if args else '.'
+    @command("dir", "System Commands", "[path] [pattern] [--sort name|size|mtime|none] [-r] [--wide]",
+             "list directory contents", blocking=True,
+             options={"--sort": str, "--reverse": bool, "-r": "--reverse", "--wide": bool, "-w": "--wide"})
+    def cmd_dir(self, args, opts):
+        path, pattern = self.dir_target(args)
+        sort = (opts['sort'] or 'name').lower()
+        if sort not in ('name', 'size', 'mtime', 'none'):
+            self.print_error("Usage: dir [path] [pattern] [--sort name|size|mtime|none] [-r] [--wide]")
+            return
+        total_size = 0
+        file_count = 0
+        dir_count = 0
+        # The wide layout shows names only, so it skips the per-file stat.
+        sized = not opts['wide'] or sort in ('size', 'mtime')
         try:
-            items = os.listdir(path)
-            total_size = 0
-            file_count = 0
-            dir_count = 0
-            
+            entries = self.scan_dir(path, pattern, need_mtime=sort == 'mtime', need_size=sized)
+            if sort != 'none':
+                entries = self.sort_dir(entries, sort, opts['reverse'])
+
             print(f"{Fore.CYAN}Directory of {os.path.abspath(path)}{Style.RESET_ALL}\n")
-            
-            for item in sorted(items):
-                item_path = os.path.join(path, item)
-                if os.path.isdir(item_path):
-                    print(f"{Fore.BLUE}<DIR>     {item}{Style.RESET_ALL}")
-                    dir_count += 1
-                else:
-                    size = os.path.getsize(item_path)
-                    total_size += size
-                    file_count += 1
-                    print(f"{size:>10} {item}")
-            
-            print(f"\n{Fore.GREEN}{file_count} File(s)  {total_size:,} bytes")
+
+            if opts['wide']:
+                entries = list(entries)
+                names = [f"[{name}]" if is_dir else name for name, is_dir, size, mtime in entries]
+                for name, is_dir, size, mtime in entries:
+                    if is_dir:
+                        dir_count += 1
+                    else:
+                        file_count += 1
+                        total_size += size
+                self.print_columns(names)
+            else:
+                for name, is_dir, size, mtime in entries:
+                    if is_dir:
+                        print(f"{Fore.BLUE}<DIR>     {name}{Style.RESET_ALL}")
+                        dir_count += 1
+                    else:
+                        total_size += size
+                        file_count += 1
+                        print(f"{size:>10} {name}")
+
+            if sized:
+                print(f"\n{Fore.GREEN}{file_count} File(s)  {total_size:,} bytes")
+            else:
+                print(f"\n{Fore.GREEN}{file_count} File(s)")
             print(f"{dir_count} Dir(s){Style.RESET_ALL}")
-            
-        except Exception as e:
+
+        except OSError as e:
             self.print_error(f"Cannot access directory: {e}")
+
+    @records("dir")
+    def iter_dir(self, args, opts):
+        path, pattern = self.dir_target(args)
+        entries = self.scan_dir(path, pattern, need_mtime=True)
+        if opts['sort'] and opts['sort'].lower() != 'none':
+            entries = self.sort_dir(entries, opts['sort'].lower(), opts['reverse'])
+        for name, is_dir, size, mtime in entries:
+            yield {'name': name, 'type': 'dir' if is_dir else 'file', 'size': size, 'mtime': mtime}
+
+    def dir_target(self, args):
+        # "dir *.py" and "dir src/*.py" split into folder and glob pattern.
+        path = args[0] if args else '.'
+        pattern = args[1] if len(args) > 1 else None
+        if pattern is None and any(c in path for c in '*?[') and not os.path.isdir(path):
+            path, pattern = os.path.split(path)
+            path = path or '.'
+        return path, pattern
+
+    def scan_dir(self, path, pattern=None, need_mtime=False, need_size=True):
+        # Yields (name, is_dir, size, mtime) straight from os.scandir. The
+        # type comes from the cached DirEntry, so directories cost no stat
+        # call, and files only need one (none at all on Windows).
+        match = None
+        if pattern:
+            import fnmatch
+            flags = re.IGNORECASE if os.name == 'nt' else 0
+            match = re.compile(fnmatch.translate(pattern), flags).match
+        with os.scandir(path) as it:
+            for count, entry in enumerate(it):
+                if count & 1023 == 0:
+                    self.check_cancelled()
+                name = entry.name
+                if match is not None and not match(name):
+                    continue
+                try:
+                    is_dir = entry.is_dir()
+                    if is_dir:
+                        if need_mtime:
+                            yield name, True, 0, entry.stat().st_mtime
+                        else:
+                            yield name, True, 0, 0
+                    elif need_size or need_mtime:
+                        st = entry.stat()
+                        yield name, False, st.st_size, st.st_mtime
+                    else:
+                        yield name, False, 0, 0
+                except OSError:
+                    yield name, False, 0, 0
+
+    def sort_dir(self, entries, sort, reverse=False):
+        # Names sort A-Z; sizes and times sort largest/newest first, like ls.
+        if sort == 'size':
+            return sorted(entries, key=lambda e: e[2], reverse=not reverse)
+        if sort == 'mtime':
+            return sorted(entries, key=lambda e: e[3], reverse=not reverse)
+        return sorted(entries, reverse=reverse)
+
+    def print_columns(self, names):
+        if not names:
+            return
+        import shutil
+        width = max(len(name) for name in names) + 2
+        columns = max(1, shutil.get_terminal_size().columns // width)
+        rows = -(-len(names) // columns)
+        for row in range(rows):
+            print("".join(name.ljust(width) for name in names[row::rows]).rstrip())
     
+    @command("cd", "System Commands", "[path]", "change directory")
     def cmd_cd(self, args):
         if not args:
             print(os.getcwd())
@@ -214,47 +2481,194 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Cannot change directory: {e}")
 
+    @command("cls", "System Commands", "", "clear screen")
     def cmd_cls(self, args):
-        os.system('cls' if os.name == 'nt' else 'clear')
+        self.clear_screen()
     
-    def cmd_copy(self, args):
-        if len(args) < 2:
-            self.print_error("Usage: copy <source> <destination>")
+    @command("copy", "System Commands", "<source>[/] <destination> [--skip mtime|hash]",
+             "copy files or folders, resuming interrupted copies; copying into an existing folder puts the "
+             "source inside it unless the source ends with a separator, and with --skip a folder is "
+             "mirrored onto the destination itself", min_args=2, blocking=True,
+             options={"--skip": str})
+    def cmd_copy(self, args, opts):
+        skip = opts['skip'] and opts['skip'].lower()
+        if skip not in (None, 'mtime', 'hash'):
+            self.print_error("Usage: copy <source> <destination> [--skip mtime|hash]")
             return
-        
-        try:
-            import shutil
-            shutil.copy2(args[0], args[1])
+        if not os.path.lexists(args[0]):
+            self.print_error(f"Source not found: {args[0]}")
+            return
+        if skip and os.path.isdir(args[0]):
+            # A sync mirrors the folder onto the destination, so running it
+            # again updates the same tree instead of nesting a new copy.
+            target = args[1]
+        else:
+            target = self.copy_target(args[0], args[1])
+        copier = self.copy_tree(args[0], target, skip)
+        if copier is not None and not copier.errors:
             self.print_success(f"Copied {args[0]} to {args[1]}")
-        except Exception as e:
-            self.print_error(f"Copy failed: {e}")
     
+    @command("move", "System Commands", "<source> <destination>", "move/rename files or folders", min_args=2,
+             blocking=True)
     def cmd_move(self, args):
-        if len(args) < 2:
-            self.print_error("Usage: move <source> <destination>")
+        import errno
+        import shutil
+        source = args[0]
+        if not os.path.lexists(source):
+            self.print_error(f"Source not found: {source}")
+            return
+        target = self.copy_target(source, args[1])
+        try:
+            os.rename(source, target)
+            self.print_success(f"Moved {source} to {args[1]}")
+            return
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                self.print_error(f"Move failed: {e}")
+                return
+        
+        # Another filesystem: copy, then remove the source only if every file made it.
+        copier = self.copy_tree(source, target)
+        if copier is None:
+            return
+        if copier.errors:
+            self.print_warning(f"Kept {source} because some files could not be copied")
             return
+        try:
+            if os.path.isdir(source) and not os.path.islink(source):
+                shutil.rmtree(source)
+            else:
+                os.remove(source)
+            self.print_success(f"Moved {source} to {args[1]}")
+        except OSError as e:
+            self.print_error(f"Copied, but could not remove the source: {e}")
+
+    def copy_target(self, source, destination):
+        # Like cp: copying into an existing folder keeps the source's name,
+        # unless the source ends with a separator (rsync's "contents of").
+        if os.path.isdir(destination) and not source.endswith(('/', os.sep)):
+            return os.path.join(destination, os.path.basename(os.path.normpath(source)))
+        return destination
+
+    def copy_tree(self, source, target, skip=None):
+        import shutil
+        started = time.perf_counter()
+        
+        def progress(files, size):
+            rate = size / max(time.perf_counter() - started, 1e-9) / (1024 * 1024)
+            print(f"  Copied {files} files, {self.format_bytes(size)} ({rate:.1f} MB/s)...", flush=True)
+        
+        copier = FileCopier(skip=skip, check=self.check_cancelled, progress=progress)
+        folders = []
+        
+        def jobs():
+            for path, depth, dirs, files in walker.walk(source):
+                folder = os.path.normpath(os.path.join(target, os.path.relpath(path, source)))
+                os.makedirs(folder, exist_ok=True)
+                folders.append((path, folder))
+                for name, st in files:
+                    yield os.path.join(path, name), os.path.join(folder, name), st
         
         try:
-            import shutil
-            shutil.move(args[0], args[1])
-            self.print_success(f"Moved {args[0]} to {args[1]}")
-        except Exception as e:
-            self.print_error(f"Move failed: {e}")
+            if os.path.isdir(source) and not os.path.islink(source):
+                inside = os.path.join(os.path.abspath(target), '')
+                if inside.startswith(os.path.join(os.path.abspath(source), '')):
+                    self.print_error("Cannot copy a folder into itself")
+                    return None
+                walker = TreeWalker(hidden=True, check=self.check_cancelled)
+                copier.run(jobs())
+                # Set folder times last, since copying into a folder changes its mtime.
+                for path, folder in reversed(folders):
+                    try:
+                        shutil.copystat(path, folder)
+                    except OSError:
+                        pass
+            else:
+                copier.run([(source, target, os.lstat(source))])
+        except OSError as e:
+            self.print_error(f"Copy failed: {e}")
+            return None
+        elapsed = time.perf_counter() - started
+        
+        for error in copier.errors:
+            self.print_error(f"Could not copy {error}")
+        details = [f"{copier.files} files, {self.format_bytes(copier.bytes)}",
+                   f"{copier.bytes / max(elapsed, 1e-9) / (1024 * 1024):.1f} MB/s"]
+        if copier.skipped:
+            details.append(f"{copier.skipped} unchanged skipped")
+        if copier.resumed:
+            details.append(f"{copier.resumed} resumed")
+        print(f"  {', '.join(details)}")
+        return copier
     
+    @command("del", "System Commands", "<filename>", "delete file", min_args=1)
     def cmd_del(self, args):
-        if not args:
-            self.print_error("Usage: del <filename>")
-            return
-        
         try:
             os.remove(args[0])
             self.print_success(f"Deleted {args[0]}")
         except Exception as e:
             self.print_error(f"Delete failed: {e}")
 
+    @command("run", "System Commands", "[--timeout <seconds>] [--tee <file>] <command>",
+             "run a system command, streaming its output", min_args=1, blocking=True,
+             options={"--timeout": float, "--tee": str}, options_first=True)
+    def cmd_run(self, args, opts):
+        status = self.execute_system_command(" ".join(args), timeout=opts['timeout'], tee=opts['tee'])
+        if status != 0 and status != 124:
+            self.print_error(f"Command exited with status {status}")
+        return status
+
+    @command("page", "System Commands", "<command>", "run a command and show long output in a pager", min_args=1)
+    def cmd_page(self, args):
+        return self.output.paged(lambda: self.execute(" ".join(args)))
+
+    @command("pager", "System Commands", "[on|off]", "page every command's output when it is longer than the screen")
+    def cmd_pager(self, args):
+        if args:
+            if args[0].lower() not in ('on', 'off'):
+                self.print_error("Usage: pager [on|off]")
+                return
+            self.output.pager = args[0].lower() == 'on'
+        print(f"Pager is {'on' if self.output.pager else 'off'}")
+
+    @command("history", "System Commands", "[pattern] [--prefix <text>] [--slow] [--failed] [--limit <n>]",
+             "search the command history of all sessions",
+             options={"--prefix": str, "--slow": bool, "--failed": bool, "--limit": int, "-n": "--limit"})
+    def cmd_history(self, args, opts):
+        limit = opts['limit'] or 20
+        if opts['prefix'] is not None:
+            matches = self.history.prefix(opts['prefix'], limit)
+        elif opts['slow']:
+            matches = self.history.slowest(limit)
+        elif opts['failed']:
+            matches = self.history.failed(limit)
+        elif args:
+            matches = self.history.search(" ".join(args), limit)
+        else:
+            matches = self.history.last(limit)[::-1]
+        
+        if not matches:
+            print("No matching history entries.")
+            return
+        
+        history = self.history
+        print(f"{'#':>7}  {'When':<16} {'Time':>9} {'Exit':>4}  Command")
+        for index in matches:
+            when = datetime.datetime.fromtimestamp(history.timestamps[index]).strftime("%Y-%m-%d %H:%M")
+            status = history.statuses[index]
+            color = Fore.RED if status else ""
+            print(f"{index + 1:>7}  {when:<16} {history.durations[index]:>7.0f}ms {color}{status:>4}{Style.RESET_ALL}  {history.commands[index]}")
+
+    @command("exit", "System Commands", "", "quit Advanced CMD")
+    def cmd_exit(self, args):
+        self.print_success("Goodbye!")
+        self.running = False
+
 #SYSTEM INFO:
 
+    @command("sysinfo", "System Info", "", "display comprehensive system information (CPU, RAM, OS)", uses_psutil=True, blocking=True)
     def cmd_sysinfo(self, args):
+        import psutil
         print(f"{Fore.CYAN}System Information:{Style.RESET_ALL}")
         print(f"OS: {platform.system()} {platform.release()}")
         print(f"Architecture: {platform.architecture()[0]}")
@@ -268,13 +2682,15 @@ class AdvancedCMD:
         print(f"Used RAM: {(memory.total - memory.available) / (1024**3):.2f} GB")
         
         print(f"CPU Cores: {psutil.cpu_count(logical=False)} physical, {psutil.cpu_count(logical=True)} logical")
-        print(f"CPU Usage: {psutil.cpu_percent(interval=1):.1f}%")
+        print(f"CPU Usage: {self.cpu.percent():.1f}%")
         
         disk = psutil.disk_usage('/')
         print(f"Disk Total: {disk.total / (1024**3):.2f} GB")
         print(f"Disk Free: {disk.free / (1024**3):.2f} GB")
 
+    @command("netinfo", "System Info", "", "show network interfaces, IP addresses, subnet masks", uses_psutil=True)
     def cmd_netinfo(self, args):
+        import psutil
         print(f"{Fore.CYAN}Network Information:{Style.RESET_ALL}")
         
         interfaces = psutil.net_if_addrs()
@@ -296,19 +2712,30 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Could not get network stats: {e}")
 
+    @command("ps", "System Info", "", "list all running processes with PID, CPU and memory usage", uses_psutil=True)
     def cmd_ps(self, args):
         print(f"{Fore.CYAN}Running Processes:{Style.RESET_ALL}")
         print(f"{'PID':<8} {'Name':<25} {'CPU%':<8} {'Memory%':<10}")
         print("-" * 60)
         
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent']):
+        for info in self.iter_ps(args):
+            print(f"{info['pid']:<8} {info['name'][:24]:<25} {info['cpu_percent']:<8.1f} {info['memory_percent']:<10.1f}")
+
+    @records("ps")
+    def iter_ps(self, args):
+        import psutil
+        cpu = {proc['pid']: proc['cpu_percent'] for proc in self.cpu.top_processes()}
+        for proc in psutil.process_iter(['pid', 'name', 'memory_percent']):
             try:
                 info = proc.info
-                print(f"{info['pid']:<8} {info['name'][:24]:<25} {info['cpu_percent']:<8.1f} {info['memory_percent']:<10.1f}")
+                yield {'pid': info['pid'], 'name': info['name'] or '',
+                       'cpu_percent': cpu.get(info['pid'], 0.0), 'memory_percent': info['memory_percent'] or 0.0}
             except (psutil.NoSuchProcess, psutil.AccessDenied):
                 pass
 
+    @command("diskinfo", "System Info", "", "display disk usage for all drives and partitions", uses_psutil=True)
     def cmd_diskinfo(self, args):
+        import psutil
         print(f"{Fore.CYAN}Disk Usage Information:{Style.RESET_ALL}")
         
         for partition in psutil.disk_partitions():
@@ -327,7 +2754,9 @@ class AdvancedCMD:
             except PermissionError:
                 print(f"\n{Fore.YELLOW}{partition.device}{Style.RESET_ALL} - Access Denied")
 
+    @command("uptime", "System Info", "", "show system boot time and uptime duration", uses_psutil=True)
     def cmd_uptime(self, args):
+        import psutil
         boot_time = psutil.boot_time()
         current_time = time.time()
         uptime_seconds = current_time - boot_time
@@ -342,7 +2771,9 @@ class AdvancedCMD:
         print(f"Boot time: {boot_time_str}")
         print(f"Uptime: {days} days, {hours} hours, {minutes} minutes")
 
+    @command("temp", "System Info", "", "show CPU and GPU temperatures in real-time", uses_psutil=True, blocking=True)
     def cmd_temp(self, args):
+        import psutil
         print(f"{Fore.CYAN}System Temperature Monitor{Style.RESET_ALL}")
         
         try:
@@ -353,8 +2784,7 @@ class AdvancedCMD:
                     print(f"{Fore.YELLOW}No temperature sensors found on this system{Style.RESET_ALL}")
                     
                     print(f"\n{Fore.BLUE}CPU Usage as thermal indicator:{Style.RESET_ALL}")
-                    for i in range(5):
-                        cpu_percent = psutil.cpu_percent(interval=1)
+                    for cpu_percent in self.cpu.recent(5):
                         thermal_estimate = "Cold" if cpu_percent < 30 else "Warm" if cpu_percent < 70 else "Hot"
                         print(f"  CPU Usage: {cpu_percent:5.1f}% {thermal_estimate}")
                     return
@@ -381,13 +2811,14 @@ class AdvancedCMD:
                 print(f"{Fore.YELLOW}Temperature monitoring not supported on this system{Style.RESET_ALL}")
                 
                 print(f"\n{Fore.BLUE}CPU Usage (thermal indicator):{Style.RESET_ALL}")
-                cpu_percent = psutil.cpu_percent(interval=1)
-                print(f"Current CPU Usage: {cpu_percent:.1f}%")
+                print(f"Current CPU Usage: {self.cpu.percent():.1f}%")
                 
         except Exception as e:
             self.print_error(f"Temperature monitoring failed: {e}")
 
+    @command("whoami_plus", "System Info", "", "extended user info with groups and permissions", uses_psutil=True)
     def cmd_whoami_plus(self, args):
+        import psutil
         print(f"{Fore.CYAN}Extended User Information:{Style.RESET_ALL}")
         
         try:
@@ -408,7 +2839,7 @@ class AdvancedCMD:
             print(f"\n{Fore.YELLOW}Process Information:{Style.RESET_ALL}")
             print(f"  Process ID: {current_process.pid}")
             print(f"  Parent PID: {current_process.ppid()}")
-            print(f"  CPU Usage: {current_process.cpu_percent():.1f}%")
+            print(f"  CPU Usage: {self.cpu.process_percent(current_process.pid):.1f}%")
             print(f"  Memory Usage: {current_process.memory_info().rss / (1024*1024):.1f} MB")
             
             print(f"\n{Fore.YELLOW}Environment:{Style.RESET_ALL}")
@@ -424,38 +2855,33 @@ class AdvancedCMD:
 
 #NETWORK TOOLS:
 
+    @command("ping", "Network Tools", "<hostname_or_ip> [count]", "send ICMP ping packets to host", min_args=1, network=True, blocking=True)
     def cmd_ping(self, args):
-        if not args:
-            self.print_error("Usage: ping <hostname_or_ip>")
-            return
-        
         host = args[0]
         count = int(args[1]) if len(args) > 1 and args[1].isdigit() else 4
         
         print(f"{Fore.CYAN}Pinging {host} with {count} packets...{Style.RESET_ALL}")
         
-        try:
-            if os.name == 'nt':
-                result = subprocess.run(['ping', '-n', str(count), host], 
-                                      capture_output=True, text=True)
-            else:
-                result = subprocess.run(['ping', '-c', str(count), host], 
-                                      capture_output=True, text=True)
-            
-            if result.returncode == 0:
-                print(result.stdout)
-            else:
-                print(f"{Fore.RED}Ping failed:{Style.RESET_ALL}")
-                print(result.stderr if result.stderr else result.stdout)
-                
-        except Exception as e:
-            self.print_error(f"Ping command failed: {e}")
+        if os.name == 'nt':
+            status = self.execute_system_command(['ping', '-n', str(count), host])
+        else:
+            status = self.execute_system_command(['ping', '-c', str(count), host])
+        
+        if status != 0:
+            self.print_error("Ping failed")
 
+    @command("ports", "Network Tools", "", "scan and list all open local network ports", uses_psutil=True)
     def cmd_ports(self, args):
         print(f"{Fore.CYAN}Open Network Connections:{Style.RESET_ALL}")
         print(f"{'Protocol':<8} {'Local Address':<22} {'Remote Address':<22} {'Status':<12} {'PID':<8}")
         print("-" * 80)
         
+        for conn in self.iter_ports(args):
+            print(f"{conn['protocol']:<8} {conn['local']:<22} {conn['remote']:<22} {conn['status']:<12} {conn['pid']:<8}")
+
+    @records("ports")
+    def iter_ports(self, args):
+        import psutil
         for conn in psutil.net_connections():
             if conn.status == 'LISTEN':
                 local = f"{conn.laddr.ip}:{conn.laddr.port}" if conn.laddr else ""
@@ -463,13 +2889,11 @@ class AdvancedCMD:
                 protocol = "TCP" if conn.type == socket.SOCK_STREAM else "UDP"
                 pid = conn.pid if conn.pid else ""
                 
-                print(f"{protocol:<8} {local:<22} {remote:<22} {conn.status:<12} {pid:<8}")
+                yield {'protocol': protocol, 'local': local, 'remote': remote, 'status': conn.status, 'pid': pid}
 
+    @command("http", "Network Tools", "<url>", "fetch HTTP headers and status code from URL", min_args=1, network=True, blocking=True)
     def cmd_http(self, args):
-        if not args:
-            self.print_error("Usage: http <url>")
-            return
-        
+        import requests
         url = args[0]
         if not url.startswith(('http://', 'https://')):
             url = 'https://' + url
@@ -501,11 +2925,8 @@ class AdvancedCMD:
         except requests.RequestException as e:
             self.print_error(f"HTTP request failed: {e}")
 
+    @command("whois", "Network Tools", "<domain>", "perform WHOIS lookup for domain information", min_args=1, network=True, blocking=True)
     def cmd_whois(self, args):
-        if not args:
-            self.print_error("Usage: whois <domain>")
-            return
-        
         domain = args[0].lower().strip()
         
         print(f"{Fore.CYAN}WHOIS lookup for: {domain}{Style.RESET_ALL}")
@@ -524,11 +2945,9 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"WHOIS lookup failed: {e}")
 
+    @command("geoip", "Network Tools", "<ip_address>", "get geolocation info for IP address (country, city, ISP)", min_args=1, network=True, blocking=True)
     def cmd_geoip(self, args):
-        if not args:
-            self.print_error("Usage: geoip <ip_address>")
-            return
-        
+        import requests
         ip = args[0]
         
         print(f"{Fore.CYAN}GeoIP lookup for: {ip}{Style.RESET_ALL}")
@@ -560,11 +2979,8 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"GeoIP lookup failed: {e}")
 
+    @command("mailcheck", "Network Tools", "<email_address>", "verify if email address exists using MX lookup", min_args=1, network=True, blocking=True)
     def cmd_mailcheck(self, args):
-        if not args:
-            self.print_error("Usage: mailcheck <email_address>")
-            return
-        
         email = args[0]
         
         if '@' not in email:
@@ -582,14 +2998,17 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Email check failed: {e}")
 
+    @command("nettest", "Network Tools", "", "perform internet speed test (download, upload, ping)", network=True, blocking=True)
     def cmd_nettest(self, args):
+        import requests
         print(f"{Fore.CYAN}Internet Speed Test Starting...{Style.RESET_ALL}")
         
         try:
-            print(f"\n{Fore.YELLOW}Ping Test:{Style.RESET_ALL}")
+            print(f"\n{Fore.YELLOW}Ping Test:{Style.RESET_ALL}", flush=True)
             ping_hosts = ["8.8.8.8", "1.1.1.1", "google.com"]
             
             for host in ping_hosts:
+                self.check_cancelled()
                 try:
                     if os.name == 'nt':
                         result = subprocess.run(['ping', '-n', '4', host], 
@@ -599,13 +3018,13 @@ class AdvancedCMD:
                                               capture_output=True, text=True)
                     
                     if result.returncode == 0:
-                        print(f"  {host}: Connected")
+                        print(f"  {host}: Connected", flush=True)
                     else:
-                        print(f"  {host}: Failed")
+                        print(f"  {host}: Failed", flush=True)
                 except:
-                    print(f"  {host}: Error")
+                    print(f"  {host}: Error", flush=True)
             
-            print(f"\n{Fore.YELLOW}Connection Test:{Style.RESET_ALL}")
+            print(f"\n{Fore.YELLOW}Connection Test:{Style.RESET_ALL}", flush=True)
             
             start_time = time.time()
             try:
@@ -623,11 +3042,8 @@ class AdvancedCMD:
 
 #UTILITIES & TOOLS:
 
+    @command("calc", "Utilities & Tools", "<expression>", "evaluate mathematical expression (e.g. calc 2+2*3)", min_args=1)
     def cmd_calc(self, args):
-        if not args:
-            self.print_error("Usage: calc <expression>")
-            return
-        
         expression = " ".join(args)
         try:
             allowed_chars = set("0123456789+-*/.() ")
@@ -639,16 +3055,14 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Calculation error: {e}")
 
+    @command("timer", "Utilities & Tools", "<seconds>", "countdown timer with beep sound at end", min_args=1, blocking=True)
     def cmd_timer(self, args):
-        if not args:
-            self.print_error("Usage: timer <seconds>")
-            return
-        
         try:
             seconds = int(args[0])
             print(f"{Fore.YELLOW}Timer started for {seconds} seconds...{Style.RESET_ALL}")
             
             for i in range(seconds, 0, -1):
+                self.check_cancelled()
                 print(f"\r{Fore.RED}{i:02d}{Style.RESET_ALL}", end="", flush=True)
                 time.sleep(1)
             
@@ -662,11 +3076,8 @@ class AdvancedCMD:
         except ValueError:
             self.print_error("Please enter a valid number of seconds")
 
+    @command("note", "Utilities & Tools", "<text>", "append timestamped text to notes.txt file", min_args=1)
     def cmd_note(self, args):
-        if not args:
-            self.print_error("Usage: note <text>")
-            return
-        
         note_text = " ".join(args)
         timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
@@ -675,6 +3086,7 @@ class AdvancedCMD:
         
         self.print_success(f"Note added to {self.notes_file}")
 
+    @command("todo", "Utilities & Tools", "[add <text> | done <number> | remove <number>]", "task manager - add, list, mark done, remove tasks")
     def cmd_todo(self, args):
         if not args:
             if not self.todo_list:
@@ -721,130 +3133,417 @@ class AdvancedCMD:
         else:
             print("Usage: todo [add <text> | done <number> | remove <number>]")
 
-    def cmd_find(self, args):
+    @command("find", "Utilities & Tools",
+             "<pattern> [--glob] [--regex] [--case] [--limit <n>] [--live] | --update [path]",
+             "searches for a file by its name", blocking=True,
+             options={"--glob": bool, "--regex": bool, "--case": bool, "--limit": int, "-n": "--limit",
+                      "--live": bool, "--update": bool})
+    def cmd_find(self, args, opts):
+        if opts['update']:
+            folder = args[0] if args else '.'
+            if not os.path.isdir(folder):
+                self.print_error(f"Folder not found: {folder}")
+                return
+            started = time.perf_counter()
+            folders, rescanned = FindIndex(self.find_index_file).update(folder, self.check_cancelled)
+            self.print_success(f"Indexed {folders:,} folders under {os.path.abspath(folder)} "
+                               f"({rescanned:,} rescanned) in {time.perf_counter() - started:.2f}s")
+            return
         if not args:
-            self.print_error("Usage: find <search_string>")
+            self.print_error("Usage: find <pattern> [--glob] [--regex] [--case] [--limit <n>] [--live] | --update [path]")
             return
-        
-        search_string = " ".join(args)
-        found_files = []
-        
-        for root, dirs, files in os.walk('.'):
-            for file in files:
-                if search_string.lower() in file.lower():
-                    found_files.append(os.path.join(root, file))
-        
-        if found_files:
-            print(f"{Fore.GREEN}Found {len(found_files)} matching files:{Style.RESET_ALL}")
-            for file in found_files[:20]:
-                print(f"  {file}")
-            if len(found_files) > 20:
-                print(f"  ... and {len(found_files) - 20} more files")
-        else:
+
+        limit = opts['limit'] or 20
+        try:
+            matches, indexed = self.find_matches(args, opts)
+            found = 0
+            for match in matches:
+                if found == 0:
+                    print(f"{Fore.GREEN}Matching files:{Style.RESET_ALL}")
+                if found == limit:
+                    if indexed:
+                        more = sum(1 for _ in matches) + 1
+                        print(f"  ... and {more} more files")
+                    else:
+                        print(f"  ... stopped after {limit} matches (use --limit to see more)")
+                    break
+                print(f"  {match}")
+                found += 1
+        except UsageError as e:
+            self.print_error(str(e))
+            return
+
+        if not found:
             print("No matching files found.")
+        if indexed:
+            updated = datetime.datetime.fromtimestamp(os.path.getmtime(self.find_index_file)).strftime("%Y-%m-%d %H:%M")
+            print(f"{Fore.BLUE}(from the index of {updated}; 'find --update' refreshes it, --live searches the disk){Style.RESET_ALL}")
+
+    @records("find")
+    def iter_find(self, args, opts):
+        matches, indexed = self.find_matches(args, opts)
+        for path in matches:
+            yield {'path': path}
+
+    def find_matches(self, args, opts):
+        # Returns (paths, indexed): matching paths below the current folder,
+        # from the find index when it covers this folder, otherwise from a
+        # live walk that stops as soon as the caller stops iterating.
+        # Case-insensitive literal and glob queries search a lower-cased copy
+        # of the index, which is much faster than re.IGNORECASE.
+        term = " ".join(args)
+        fold = not opts['case'] and not opts['regex']
+        source = name_regex(term.lower() if fold else term, opts['glob'], opts['regex'])
+        flags = 0 if opts['case'] else re.IGNORECASE
+        # An anchored glob becomes "\n..." on the index so the regex engine
+        # can still scan for its literal prefix.
+        index_source = '\n' + source[1:] if opts['glob'] and source.startswith('^') else source
+        try:
+            match = re.compile(source, flags).search
+            pattern = re.compile(os.fsencode(index_source), 0 if fold else flags)
+        except re.error as e:
+            raise UsageError(f"invalid pattern: {e}")
+        index = FindIndex(self.find_index_file)
+        blob = b"" if opts['live'] else index.read()
+        scope = os.getcwd()
+        if index.covers(blob, scope):
+            paths = index.search(blob, pattern, scope, fold)
+            return (os.path.join('.', os.path.relpath(path, scope)) for path in paths), True
+        return self.walk_matches(match), False
+
+    def walk_matches(self, match):
+        walker = TreeWalker(hidden=True, stat_files=False, check=self.check_cancelled)
+        for root, depth, dirs, files in walker.walk('.'):
+            for name, _ in files:
+                if match(name):
+                    yield os.path.join(root, name)
 
-    def cmd_recent(self, args):
-        search_path = args[0] if args else '.'
+    @command("grep", "Utilities & Tools",
+             "<pattern> [path] [-i] [-F] [-l] [-c] [-m <n>] [-A <n>] [-B <n>] [-C <n>]",
+             "search file contents for a regular expression", min_args=1, blocking=True,
+             options={"--ignore-case": bool, "-i": "--ignore-case", "--fixed-strings": bool, "-F": "--fixed-strings",
+                      "--files-with-matches": bool, "-l": "--files-with-matches", "--count": bool, "-c": "--count",
+                      "--max-count": int, "-m": "--max-count", "--after-context": int, "-A": "--after-context",
+                      "--before-context": int, "-B": "--before-context", "--context": int, "-C": "--context"})
+    def cmd_grep(self, args, opts):
+        target = args[1] if len(args) > 1 else '.'
+        pattern = args[0].encode('utf-8')
+        if opts['fixed_strings']:
+            pattern = re.escape(pattern)
+        flags = re.IGNORECASE if opts['ignore_case'] else 0
+        try:
+            re.compile(pattern, flags)
+        except re.error as e:
+            self.print_error(f"Invalid pattern: {e}")
+            return
+
+        if os.path.isfile(target):
+            files = [(target, os.path.getsize(target))]
+        elif os.path.isdir(target):
+            walker = TreeWalker(check=self.check_cancelled)
+            files = sorted((os.path.join(root, name), st.st_size)
+                           for root, depth, dirs, entries in walker.walk(target)
+                           for name, st in entries if st.st_size)
+        else:
+            self.print_error(f"Path not found: {target}")
+            return
+        show_path = not os.path.isfile(target)
+
+        mode = 'files' if opts['files_with_matches'] else 'count' if opts['count'] else 'lines'
+        context = opts['context'] or 0
+        before = context if opts['before_context'] is None else opts['before_context']
+        after = context if opts['after_context'] is None else opts['after_context']
+        matched = 0
+        for path, result in self.grep_results(files, (pattern, flags, mode, before, after, opts['max_count'])):
+            matched += 1
+            if mode == 'files':
+                print(f"{Fore.MAGENTA}{path}{Style.RESET_ALL}")
+            elif mode == 'count':
+                print(f"{Fore.MAGENTA}{path}{Style.RESET_ALL}:{result}")
+            else:
+                prefix = f"{Fore.MAGENTA}{path}{Style.RESET_ALL}" if show_path else ""
+                for line in result:
+                    if line is None:
+                        print(f"{Fore.CYAN}--{Style.RESET_ALL}")
+                        continue
+                    line_no, separator, text = line
+                    text = text.decode('utf-8', 'replace')
+                    if show_path:
+                        print(f"{prefix}{separator}{Fore.GREEN}{line_no}{Style.RESET_ALL}{separator}{text}")
+                    else:
+                        print(f"{Fore.GREEN}{line_no}{Style.RESET_ALL}{separator}{text}")
+        if not matched:
+            print("No matches found.")
+
+    def grep_results(self, files, params):
+        # Files go out in batches of about 4 MB. Small searches run inline;
+        # big ones go to a process pool, with a bounded window of batches in
+        # flight whose results are yielded in submission order.
+        batches = []
+        batch = []
+        batch_size = 0
+        for path, size in files:
+            batch.append(path)
+            batch_size += size
+            if batch_size >= 4 * 1024 * 1024 or len(batch) >= 256:
+                batches.append(batch)
+                batch = []
+                batch_size = 0
+        if batch:
+            batches.append(batch)
+
+        workers = os.cpu_count() or 1
+        if workers == 1 or len(batches) == 1 or sum(size for path, size in files) < GREP_PARALLEL_BYTES:
+            for batch in batches:
+                self.check_cancelled()
+                yield from grep_files(batch, *params)
+            return
+
+        from concurrent.futures import ProcessPoolExecutor
+        pool = ProcessPoolExecutor(workers)
+        try:
+            window = []
+            for batch in batches:
+                window.append(pool.submit(grep_files, batch, *params))
+                if len(window) >= workers * 2:
+                    self.check_cancelled()
+                    yield from window.pop(0).result()
+            for future in window:
+                self.check_cancelled()
+                yield from future.result()
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+    @command("recent", "Utilities & Tools", "[path] [days] [-n <count>] [--watch] [--interval <seconds>]",
+             "show recently accessed/modified files", blocking=True,
+             options={"--limit": int, "-n": "--limit", "--watch": bool, "--interval": float})
+    def cmd_recent(self, args, opts):
+        folder = args[0] if args else '.'
         days_back = int(args[1]) if len(args) > 1 and args[1].isdigit() else 7
+        limit = opts['limit'] or 25
+        if opts['watch'] and not self.interactive:
+            self.print_error("'recent --watch' needs an interactive terminal")
+            return
         
         print(f"{Fore.CYAN}Files modified in the last {days_back} days:{Style.RESET_ALL}")
         
-        cutoff_time = time.time() - (days_back * 24 * 60 * 60)
-        recent_files = []
-        
-        for root, dirs, files in os.walk(search_path):
-            dirs[:] = [d for d in dirs if not d.startswith('.')]
-            
-            for file in files:
-                if file.startswith('.'):
-                    continue
-                    
-                file_path = os.path.join(root, file)
-                try:
-                    stat = os.stat(file_path)
-                    if stat.st_mtime > cutoff_time:
-                        recent_files.append({
-                            'path': os.path.relpath(file_path),
-                            'mtime': stat.st_mtime,
-                            'size': stat.st_size,
-                            'type': 'file'
-                        })
-                except OSError:
-                    continue
-        
-        recent_files.sort(key=lambda x: x['mtime'], reverse=True)
+        # Only the `limit` newest files are kept, in a min-heap.
+        now = time.time()
+        newest = []
+        total = 0
+        for item in self.recent_files(folder, now - days_back * 24 * 60 * 60):
+            total += 1
+            if len(newest) < limit:
+                heapq.heappush(newest, item)
+            elif item > newest[0]:
+                heapq.heapreplace(newest, item)
         
-        if not recent_files:
+        if not newest:
             print(f"{Fore.YELLOW}No recently modified files found{Style.RESET_ALL}")
-            return
-        
-        print(f"{'Modified':<20} {'Size':<12} {'File'}")
-        print("-" * 60)
-        
-        for item in recent_files[:25]:
-            mod_time = datetime.datetime.fromtimestamp(item['mtime']).strftime("%Y-%m-%d %H:%M")
-            size_str = self.format_bytes(item['size'])
-            path = item['path']
+        else:
+            print(f"{'Modified':<20} {'Size':<12} {'File'}")
+            print("-" * 60)
             
-            age_hours = (time.time() - item['mtime']) / 3600
-            if age_hours < 1:
-                color = Fore.GREEN
-            elif age_hours < 24:
-                color = Fore.YELLOW
-            else:
-                color = Style.RESET_ALL
+            for mtime, size, path in sorted(newest, reverse=True):
+                self.print_recent_row(mtime, size, path, now)
             
-            print(f"{color}{mod_time:<20} {size_str:>12} {path}{Style.RESET_ALL}")
-        
-        if len(recent_files) > 25:
-            print(f"\n{Fore.BLUE}... and {len(recent_files) - 25} more files{Style.RESET_ALL}")
+            if total > limit:
+                print(f"\n{Fore.BLUE}... and {total - limit} more files{Style.RESET_ALL}")
 
-    def cmd_tree(self, args):
-        path = args[0] if args else '.'
+        if opts['watch']:
+            self.watch_recent(folder, opts['interval'] or 2.0)
+
+    def print_recent_row(self, mtime, size, path, now):
+        mod_time = datetime.datetime.fromtimestamp(mtime).strftime("%Y-%m-%d %H:%M")
+        age_hours = (now - mtime) / 3600
+        if age_hours < 1:
+            color = Fore.GREEN
+        elif age_hours < 24:
+            color = Fore.YELLOW
+        else:
+            color = Style.RESET_ALL
+        print(f"{color}{mod_time:<20} {self.format_bytes(size):>12} {path}{Style.RESET_ALL}")
 
-    def cmd_du(self, args):
+    @records("recent")
+    def iter_recent(self, args, opts):
         folder = args[0] if args else '.'
-        
-        if not os.path.exists(folder):
-            self.print_error(f"Folder not found: {folder}")
+        days_back = int(args[1]) if len(args) > 1 and args[1].isdigit() else 7
+        for mtime, size, path in self.recent_files(folder, time.time() - days_back * 24 * 60 * 60):
+            yield {'path': path, 'mtime': mtime, 'size': size}
+
+    def recent_files(self, folder, cutoff):
+        # (mtime, size, path) of every non-hidden file newer than cutoff.
+        walker = TreeWalker(check=self.check_cancelled)
+        for root, depth, dirs, files in walker.walk(folder):
+            for name, st in files:
+                if st.st_mtime > cutoff:
+                    yield st.st_mtime, st.st_size, os.path.relpath(os.path.join(root, name))
+
+    def watch_recent(self, folder, interval):
+        # Prints every file that changes from now on: inotify on Linux,
+        # elsewhere (or when inotify is out of watches) a rescan for files
+        # newer than the previous one every `interval` seconds.
+        watcher = None
+        if sys.platform.startswith('linux'):
+            try:
+                watcher = InotifyWatcher()
+                for root, depth, dirs, files in TreeWalker(stat_files=False, check=self.check_cancelled).walk(folder):
+                    watcher.add(root)
+            except OSError as e:
+                if watcher:
+                    watcher.close()
+                watcher = None
+                self.print_warning(f"inotify unavailable ({e.strerror}), checking every {interval:g}s instead")
+        print(f"\n{Fore.CYAN}Watching {os.path.abspath(folder)} for changes (Ctrl+C to stop){Style.RESET_ALL}")
+        last = time.time()
+        try:
+            while True:
+                self.check_cancelled()
+                sys.stdout.flush()
+                changed = set()
+                if watcher:
+                    for path, is_dir in watcher.read(1.0):
+                        if os.path.basename(path).startswith('.'):
+                            continue
+                        if not is_dir:
+                            changed.add(path)
+                            continue
+                        for root, depth, dirs, files in TreeWalker(stat_files=False).walk(path):
+                            try:
+                                watcher.add(root)
+                            except OSError:
+                                pass
+                            changed.update(os.path.join(root, name) for name, st in files)
+                else:
+                    time.sleep(interval)
+                    now = time.time()
+                    changed.update(path for mtime, size, path in self.recent_files(folder, last))
+                    last = now
+                now = time.time()
+                for path in sorted(changed):
+                    try:
+                        st = os.stat(path)
+                    except OSError:
+                        continue
+                    self.print_recent_row(st.st_mtime, st.st_size, os.path.relpath(path), now)
+        except KeyboardInterrupt:
+            print(f"\n{Fore.GREEN}Stopped watching.{Style.RESET_ALL}")
+        finally:
+            if watcher:
+                watcher.close()
+
+    @command("tree", "Utilities & Tools", "[path] [--depth <n>] [--dirs-only] [--ignore <pattern|...>] [--sizes]",
+             "display directory structure as tree", blocking=True,
+             options={"--depth": int, "-L": "--depth", "--dirs-only": bool, "-d": "--dirs-only",
+                      "--ignore": str, "-I": "--ignore", "--sizes": bool, "-s": "--sizes"})
+    def cmd_tree(self, args, opts):
+        path = args[0] if args else '.'
+        if not os.path.isdir(path):
+            self.print_error(f"Folder not found: {path}")
             return
         
-        print(f"{Fore.CYAN}Analyzing disk usage for: {os.path.abspath(folder)}{Style.RESET_ALL}")
+        ignore = None
+        if opts['ignore']:
+            import fnmatch
+            ignore = re.compile("|".join(fnmatch.translate(pattern) for pattern in opts['ignore'].split('|'))).match
         
-        folder_sizes = {}
-        total_size = 0
+        # Folder sizes come from one bottom-up du pass (and its cache), so
+        # the tree is only printed once that is done; without --sizes it
+        # streams straight away.
+        totals = self.disk_usage(path) if opts['sizes'] else None
+        root = os.path.abspath(path)
+        
+        if totals is not None:
+            print(f"[{self.format_bytes(totals.get(root, [0])[0]):>10}]  {Fore.BLUE}{path}{Style.RESET_ALL}")
+        else:
+            print(f"{Fore.BLUE}{path}{Style.RESET_ALL}")
+        dir_count = 0
         file_count = 0
+        for prefix, name, is_dir, size in self.iter_tree(root, opts['depth'], opts['dirs_only'], ignore, totals):
+            label = f"{Fore.BLUE}{name}{Style.RESET_ALL}" if is_dir else name
+            if totals is not None:
+                print(f"{prefix}[{self.format_bytes(size):>10}]  {label}")
+            else:
+                print(f"{prefix}{label}")
+            if is_dir:
+                dir_count += 1
+            else:
+                file_count += 1
         
+        if opts['dirs_only']:
+            print(f"\n{dir_count} directories")
+        else:
+            print(f"\n{dir_count} directories, {file_count} files")
+
+    def iter_tree(self, root, max_depth=None, dirs_only=False, ignore=None, totals=None):
+        # Depth-first with an explicit stack, so deep trees need no recursion
+        # and only the listings of the currently open folders are held.
+        # Yields (prefix, name, is_dir, size) in print order.
+        stack = [(iter(self.tree_listing(root, dirs_only, ignore, totals is not None)), "")]
+        while stack:
+            entries, prefix = stack[-1]
+            entry = next(entries, None)
+            if entry is None:
+                stack.pop()
+                continue
+            name, is_dir, size, last, path = entry
+            if is_dir and totals is not None:
+                size = totals.get(path, [0])[0]
+            yield prefix + ("└── " if last else "├── "), name, is_dir, size
+            if is_dir and (max_depth is None or len(stack) < max_depth):
+                self.check_cancelled()
+                listing = self.tree_listing(path, dirs_only, ignore, totals is not None)
+                stack.append((iter(listing), prefix + ("    " if last else "│   ")))
+
+    def tree_listing(self, folder, dirs_only, ignore, sizes):
+        # One folder's visible entries, sorted by name:
+        # (name, is_dir, size, is_last, path).
+        entries = []
         try:
-            for root, dirs, files in os.walk(folder):
-                dirs[:] = [d for d in dirs if not d.startswith('.')]
-                
-                folder_size = 0
-                for file in files:
-                    if file.startswith('.'):
+            with os.scandir(folder) as it:
+                for entry in it:
+                    name = entry.name
+                    if name.startswith('.') or (ignore is not None and ignore(name)):
                         continue
                     try:
-                        file_path = os.path.join(root, file)
-                        size = os.path.getsize(file_path)
-                        folder_size += size
-                        total_size += size
-                        file_count += 1
+                        is_dir = entry.is_dir(follow_symlinks=False)
+                        if dirs_only and not is_dir:
+                            continue
+                        size = entry.stat(follow_symlinks=False).st_size if sizes and not is_dir else 0
                     except OSError:
                         continue
-                
-                if folder_size > 0:
-                    rel_path = os.path.relpath(root, folder)
-                    if rel_path == '.':
-                        rel_path = os.path.basename(os.path.abspath(folder))
-                    folder_sizes[rel_path] = folder_size
-            
-            sorted_folders = sorted(folder_sizes.items(), key=lambda x: x[1], reverse=True)
+                    entries.append((name, is_dir, size, False, entry.path))
+        except OSError:
+            return []
+        entries.sort()
+        if entries:
+            entries[-1] = entries[-1][:3] + (True,) + entries[-1][4:]
+        return entries
+
+    @command("du", "Utilities & Tools", "[folder] [--max-depth <n>] [--top <n>] [--allocated] [--refresh]",
+             "show disk usage and size of folder", blocking=True,
+             options={"--max-depth": int, "-d": "--max-depth", "--top": int, "-n": "--top", "--allocated": bool,
+                      "--refresh": bool})
+    def cmd_du(self, args, opts):
+        folder = args[0] if args else '.'
+        
+        if not os.path.exists(folder):
+            self.print_error(f"Folder not found: {folder}")
+            return
+        
+        kind = "allocated" if opts['allocated'] else "apparent"
+        print(f"{Fore.CYAN}Analyzing disk usage for: {os.path.abspath(folder)} ({kind} size){Style.RESET_ALL}")
+        
+        try:
+            totals = self.disk_usage(folder, opts['allocated'], opts['refresh'])
+            root = os.path.abspath(folder)
+            total_size, file_count, _ = totals.get(root, (0, 0, 0))
             
             print(f"\n{Fore.YELLOW}Disk Usage Analysis:{Style.RESET_ALL}")
             print(f"{'Size':<12} {'Percentage':<12} {'Folder'}")
             print("-" * 50)
             
-            for folder_path, size in sorted_folders[:15]:
+            for size, path in self.largest_folders(totals, opts['max_depth'], opts['top'] or 15):
                 percentage = (size / total_size) * 100 if total_size > 0 else 0
                 size_str = self.format_bytes(size)
                 
@@ -855,27 +3554,95 @@ class AdvancedCMD:
                 else:
                     color = Fore.GREEN
                 
-                print(f"{color}{size_str:>12} {percentage:>10.1f}% {folder_path}{Style.RESET_ALL}")
+                print(f"{color}{size_str:>12} {percentage:>10.1f}% {self.du_label(path, root)}{Style.RESET_ALL}")
             
             print(f"\n{Fore.GREEN}Summary:{Style.RESET_ALL}")
             print(f"Total Size: {self.format_bytes(total_size)}")
             print(f"Total Files: {file_count:,}")
-            print(f"Total Folders: {len(folder_sizes)}")
+            print(f"Total Folders: {max(len(totals) - 1, 0):,}")
             
-        except Exception as e:
+        except OSError as e:
             self.print_error(f"Disk usage analysis failed: {e}")
 
-    def cmd_backup(self, args):
-        if len(args) < 2:
-            self.print_error("Usage: backup <source_folder> <destination>")
-            return
-        
+    @records("du")
+    def iter_du(self, args, opts):
+        folder = args[0] if args else '.'
+        totals = self.disk_usage(folder, opts['allocated'], opts['refresh'])
+        root = os.path.abspath(folder)
+        if opts['top']:
+            paths = [path for size, path in self.largest_folders(totals, opts['max_depth'], opts['top'])]
+        else:
+            paths = sorted(path for path, total in totals.items()
+                           if opts['max_depth'] is None or total[2] <= opts['max_depth'])
+        for path in paths:
+            size, files, depth = totals[path]
+            yield {'path': self.du_label(path, root), 'size': size, 'files': files, 'depth': depth}
+
+    def disk_usage(self, folder, allocated=False, refresh=False):
+        # Recursive totals for every folder below `folder`, keyed by absolute
+        # path: [size, files, depth]. A file with several hard links is
+        # counted once; allocated=True sums st_blocks * 512 instead of
+        # st_size. Unchanged folders come from the du cache (see DuCache).
+        root = os.path.abspath(folder)
+        cache = DuCache(self.du_cache_file)
+        cached = {} if refresh else cache.load(root)
+        walker = DuWalker(cached, check=self.check_cancelled)
+        blocks = allocated and os.name != 'nt'
+        # Folders modified in the last two seconds are not cached: a change
+        # later in the same mtime tick would go unnoticed.
+        settled = time.time_ns() - 2 * 10**9
+        totals = {}
+        seen = set()
+        fresh = []
+        for path, depth, dirs, row in walker.walk(root):
+            ino, mtime, size, block_count, count, links, changed = row
+            size = block_count * 512 if blocks else size
+            for dev, link_ino, link_size, link_blocks in links:
+                key = (dev, link_ino)
+                if key in seen:
+                    continue
+                seen.add(key)
+                size += link_blocks * 512 if blocks else link_size
+                count += 1
+            totals[path] = [size, count, depth]
+            if changed and mtime < settled:
+                fresh.append((path, ino, mtime, row[2], block_count, row[4], json.dumps(dirs), json.dumps(links), 0))
+        cache.save(root, fresh, [path for path in cached if path not in totals])
+        for path in sorted(totals, key=lambda p: totals[p][2], reverse=True):
+            if totals[path][2]:
+                parent = totals[os.path.dirname(path)]
+                parent[0] += totals[path][0]
+                parent[1] += totals[path][1]
+        return totals
+
+    def largest_folders(self, totals, max_depth, top):
+        # heapq.nlargest keeps only `top` entries instead of sorting every folder.
+        return heapq.nlargest(top, ((total[0], path) for path, total in totals.items()
+                                    if max_depth is None or total[2] <= max_depth))
+
+    def du_label(self, path, root):
+        rel_path = os.path.relpath(path, root)
+        if rel_path == '.':
+            return os.path.basename(os.path.abspath(root))
+        return rel_path
+
+    @command("backup", "Utilities & Tools", "<source_folder> <destination> [--level <0-9>] [--incremental]",
+             "create compressed backup of folder", min_args=2, blocking=True,
+             options={"--level": int, "--incremental": bool})
+    def cmd_backup(self, args, opts):
         source = args[0]
         destination = args[1]
+        level = 6 if opts['level'] is None else opts['level']
         
         if not os.path.exists(source):
             self.print_error(f"Source folder not found: {source}")
             return
+        if not 0 <= level <= 9:
+            self.print_error("Compression level must be between 0 and 9")
+            return
+        if opts['incremental']:
+            self.incremental_backup(source, destination, level)
+            return
         
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         backup_name = f"{os.path.basename(source)}_backup_{timestamp}.zip"
@@ -883,52 +3650,290 @@ class AdvancedCMD:
         
         print(f"{Fore.CYAN}Creating backup: {source} -> {backup_path}{Style.RESET_ALL}")
         
+        pool = None
         try:
             os.makedirs(destination, exist_ok=True)
+            walker = TreeWalker(check=self.check_cancelled)
+            files = sorted((os.path.join(root, name), st) for root, depth, dirs, entries in walker.walk(source)
+                           for name, st in entries)
+            
+            workers = os.cpu_count() or 1
+            if workers > 1 and sum(st.st_size for path, st in files) >= BACKUP_PARALLEL_BYTES:
+                from concurrent.futures import ProcessPoolExecutor
+                pool = ProcessPoolExecutor(workers)
+            
+            started = time.perf_counter()
+            
+            def progress(count, size):
+                rate = size / max(time.perf_counter() - started, 1e-9) / (1024 * 1024)
+                print(f"  Processed {count} files ({rate:.1f} MB/s)...", flush=True)
             
             with zipfile.ZipFile(backup_path, 'w', zipfile.ZIP_DEFLATED) as zipf:
-                file_count = 0
-                total_size = 0
-                
-                for root, dirs, files in os.walk(source):
-                    dirs[:] = [d for d in dirs if not d.startswith('.')]
-                    
-                    for file in files:
-                        if file.startswith('.'):
-                            continue
-                            
-                        file_path = os.path.join(root, file)
-                        arcname = os.path.relpath(file_path, source)
-                        
-                        try:
-                            zipf.write(file_path, arcname)
-                            file_count += 1
-                            total_size += os.path.getsize(file_path)
-                            
-                            if file_count % 100 == 0:
-                                print(f"  Processed {file_count} files...")
-                        except Exception as e:
-                            print(f"  Warning: Could not backup {file_path}: {e}")
+                writer = BackupWriter(zipf, source, level, pool, workers, self.check_cancelled, progress)
+                for path, st in files:
+                    writer.add(path, st)
+                writer.close()
+            elapsed = time.perf_counter() - started
             
+            for warning in writer.warnings:
+                print(f"  Warning: Could not backup {warning}")
+            
+            total_size = writer.bytes
             backup_size = os.path.getsize(backup_path)
             compression_ratio = (1 - backup_size / total_size) * 100 if total_size > 0 else 0
             
             self.print_success(f"Backup created successfully!")
-            print(f"  Files backed up: {file_count}")
+            print(f"  Files backed up: {writer.files}")
             print(f"  Original size: {self.format_bytes(total_size)}")
             print(f"  Backup size: {self.format_bytes(backup_size)}")
             print(f"  Compression: {compression_ratio:.1f}%")
+            print(f"  Throughput: {total_size / max(elapsed, 1e-9) / (1024 * 1024):.1f} MB/s")
             print(f"  Location: {backup_path}")
             
         except Exception as e:
             self.print_error(f"Backup failed: {e}")
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
 
-    def cmd_diff(self, args):
-        if len(args) < 2:
-            self.print_error("Usage: diff <file1> <file2>")
+    def incremental_backup(self, source, destination, level):
+        # Only files whose size or mtime differ from the previous snapshot
+        # are read; their chunks are hashed and stored by worker processes.
+        store = ChunkStore(os.path.join(destination, f"{os.path.basename(os.path.abspath(source))}_backup_store"))
+        print(f"{Fore.CYAN}Incremental backup: {source} -> {store.root}{Style.RESET_ALL}")
+        
+        pool = None
+        try:
+            snapshots = store.snapshot_ids()
+            known = {}
+            if snapshots:
+                previous = store.load(snapshots[-1])
+                # A file written within 2 s of the last run may have changed again
+                # without its mtime moving, so it is read again.
+                settled = previous['started'] - 2 * 10**9
+                known = {entry['path']: entry for entry in previous['files'] if entry['mtime'] < settled}
+            
+            started_ns = time.time_ns()
+            started = time.perf_counter()
+            walker = TreeWalker(check=self.check_cancelled)
+            files = sorted((os.path.join(root, name), st) for root, depth, dirs, entries in walker.walk(source)
+                           for name, st in entries)
+            
+            entries = []
+            changed = []
+            for path, st in files:
+                rel_path = os.path.relpath(path, source).replace(os.sep, '/')
+                old = known.get(rel_path)
+                if old and old['size'] == st.st_size and old['mtime'] == st.st_mtime_ns:
+                    entries.append(old)
+                    continue
+                entry = {'path': rel_path, 'size': st.st_size, 'mtime': st.st_mtime_ns, 'mode': st.st_mode & 0o7777}
+                entries.append(entry)
+                changed.append((path, entry))
+            
+            batches = []
+            batch = []
+            batch_bytes = 0
+            for path, entry in changed:
+                batch.append((path, entry))
+                batch_bytes += entry['size']
+                if batch_bytes >= BACKUP_CHUNK_BYTES or len(batch) >= 64:
+                    batches.append(batch)
+                    batch = []
+                    batch_bytes = 0
+            if batch:
+                batches.append(batch)
+            
+            def items(batch):
+                return [(path, level == 0 or os.path.splitext(path)[1].lower() in STORED_EXTENSIONS)
+                        for path, entry in batch]
+            
+            os.makedirs(store.chunk_dir, exist_ok=True)
+            workers = os.cpu_count() or 1
+            if workers > 1 and sum(entry['size'] for path, entry in changed) >= BACKUP_PARALLEL_BYTES:
+                from concurrent.futures import ProcessPoolExecutor
+                pool = ProcessPoolExecutor(workers)
+                futures = [pool.submit(store_file_chunks, items(batch), store.chunk_dir, level) for batch in batches]
+                results = (future.result() for future in futures)
+            else:
+                results = (store_file_chunks(items(batch), store.chunk_dir, level) for batch in batches)
+            
+            warnings = []
+            done = 0
+            read_bytes = 0
+            stored_bytes = 0
+            for batch, batch_results in zip(batches, results):
+                self.check_cancelled()
+                for (path, entry), result in zip(batch, batch_results):
+                    if isinstance(result, str):
+                        warnings.append(f"{path}: {result}")
+                        continue
+                    entry['hash'], entry['chunks'], entry['size'], written = result
+                    read_bytes += entry['size']
+                    stored_bytes += written
+                    done += 1
+                    if done % 100 == 0:
+                        rate = read_bytes / max(time.perf_counter() - started, 1e-9) / (1024 * 1024)
+                        print(f"  Processed {done} changed files ({rate:.1f} MB/s)...", flush=True)
+            
+            entries = [entry for entry in entries if 'hash' in entry]
+            snapshot_id = store.save({'source': os.path.abspath(source), 'started': started_ns,
+                                      'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                                      'files': entries})
+            elapsed = time.perf_counter() - started
+            
+            for warning in warnings:
+                print(f"  Warning: Could not backup {warning}")
+            
+            self.print_success(f"Snapshot {snapshot_id} created successfully!")
+            print(f"  Files in snapshot: {len(entries)} ({self.format_bytes(sum(e['size'] for e in entries))})")
+            print(f"  Changed files: {done} ({self.format_bytes(read_bytes)} read)")
+            print(f"  New data stored: {self.format_bytes(stored_bytes)}")
+            print(f"  Throughput: {read_bytes / max(elapsed, 1e-9) / (1024 * 1024):.1f} MB/s")
+            print(f"  Location: {store.root}")
+            
+        except Exception as e:
+            self.print_error(f"Backup failed: {e}")
+        finally:
+            if pool is not None:
+                pool.shutdown(wait=True, cancel_futures=True)
+
+    def open_snapshot(self, path, snapshot_id):
+        store = ChunkStore(path)
+        snapshots = store.snapshot_ids()
+        if not snapshots:
+            self.print_error(f"No snapshots found in {path}")
+            return store, None
+        if snapshot_id is not None and snapshot_id not in snapshots:
+            self.print_error(f"Snapshot not found: {snapshot_id}")
+            return store, None
+        return store, snapshots
+
+    @command("restore", "Utilities & Tools", "<backup_store> [target_folder] [--snapshot <id>]",
+             "list or restore snapshots of an incremental backup", min_args=1, blocking=True,
+             options={"--snapshot": str})
+    def cmd_restore(self, args, opts):
+        store, snapshots = self.open_snapshot(args[0], opts['snapshot'])
+        if snapshots is None:
+            return
+        
+        try:
+            if len(args) < 2:
+                print(f"{Fore.CYAN}Snapshots in {store.root}:{Style.RESET_ALL}")
+                for snapshot_id in snapshots:
+                    manifest = store.load(snapshot_id)
+                    size = sum(entry['size'] for entry in manifest['files'])
+                    print(f"  {Fore.YELLOW}{snapshot_id}{Style.RESET_ALL}  {manifest['created']}  "
+                          f"{len(manifest['files'])} files, {self.format_bytes(size)}")
+                return
+            
+            snapshot_id = opts['snapshot'] or snapshots[-1]
+            target = args[1]
+            if os.path.exists(target) and (not os.path.isdir(target) or os.listdir(target)):
+                self.print_error(f"Target must be a new or empty folder: {target}")
+                return
+            manifest = store.load(snapshot_id)
+        except (OSError, ValueError, KeyError) as e:
+            self.print_error(f"Could not read snapshot: {e}")
+            return
+        
+        print(f"{Fore.CYAN}Restoring snapshot {snapshot_id} -> {target}{Style.RESET_ALL}")
+        
+        import zlib
+        
+        def restore_file(entry):
+            path = os.path.join(target, *entry['path'].split('/'))
+            digest = hashlib.sha256()
+            try:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    for chunk_id in entry['chunks']:
+                        data = store.read_chunk(chunk_id)
+                        digest.update(data)
+                        f.write(data)
+                if 'mode' in entry:
+                    os.chmod(path, entry['mode'])
+                os.utime(path, ns=(entry['mtime'], entry['mtime']))
+            except (OSError, zlib.error) as e:
+                return f"{entry['path']}: {e}"
+            if digest.hexdigest() != entry['hash']:
+                return f"{entry['path']}: content does not match the snapshot"
+            return None
+        
+        started = time.perf_counter()
+        failed = []
+        # Chunk reads, decompression and hashing release the GIL, so a few
+        # files are restored at once.
+        pool = ThreadPoolExecutor(min(8, (os.cpu_count() or 1) * 2))
+        try:
+            os.makedirs(target, exist_ok=True)
+            for error in pool.map(restore_file, manifest['files']):
+                self.check_cancelled()
+                if error:
+                    failed.append(error)
+        except OSError as e:
+            self.print_error(f"Restore failed: {e}")
+            return
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        elapsed = time.perf_counter() - started
+        
+        for error in failed:
+            print(f"  Warning: Could not restore {error}")
+        size = sum(entry['size'] for entry in manifest['files'])
+        restored = len(manifest['files']) - len(failed)
+        if failed:
+            self.print_error(f"Restored {restored} of {len(manifest['files'])} files")
+        else:
+            self.print_success(f"Restored {restored} files ({self.format_bytes(size)})")
+        print(f"  Throughput: {size / max(elapsed, 1e-9) / (1024 * 1024):.1f} MB/s")
+
+    @command("verify", "Utilities & Tools", "<backup_store> [--snapshot <id>]",
+             "check the chunks of an incremental backup for damage", min_args=1, blocking=True,
+             options={"--snapshot": str})
+    def cmd_verify(self, args, opts):
+        store, snapshots = self.open_snapshot(args[0], opts['snapshot'])
+        if snapshots is None:
+            return
+        snapshot_ids = [opts['snapshot']] if opts['snapshot'] else snapshots
+        
+        try:
+            manifests = {snapshot_id: store.load(snapshot_id) for snapshot_id in snapshot_ids}
+        except (OSError, ValueError) as e:
+            self.print_error(f"Could not read snapshot: {e}")
             return
+        chunks = list(dict.fromkeys(chunk_id for manifest in manifests.values()
+                                    for entry in manifest['files'] for chunk_id in entry['chunks']))
+        print(f"{Fore.CYAN}Verifying {len(chunks)} chunks from {len(manifests)} snapshot(s)...{Style.RESET_ALL}")
+        
+        started = time.perf_counter()
+        damaged = set()
+        pool = ThreadPoolExecutor(min(32, (os.cpu_count() or 1) * 2))
+        try:
+            for chunk_id, ok in zip(chunks, pool.map(store.check_chunk, chunks)):
+                self.check_cancelled()
+                if not ok:
+                    damaged.add(chunk_id)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        elapsed = time.perf_counter() - started
         
+        if not damaged:
+            self.print_success(f"All {len(chunks)} chunks are intact ({elapsed:.2f}s)")
+            return
+        self.print_error(f"{len(damaged)} of {len(chunks)} chunks are missing or damaged")
+        for snapshot_id, manifest in manifests.items():
+            for entry in manifest['files']:
+                if damaged.intersection(entry['chunks']):
+                    print(f"  {Fore.RED}{snapshot_id}: {entry['path']}{Style.RESET_ALL}")
+
+    @command("diff", "Utilities & Tools", "<file1> <file2> [-U <lines>] [-w] [--stat]",
+             "compare two files and show differences", min_args=2, blocking=True,
+             options={"--unified": int, "-U": "--unified", "--ignore-space": bool, "-w": "--ignore-space",
+                      "--stat": bool})
+    def cmd_diff(self, args, opts):
         file1, file2 = args[0], args[1]
+        context = 3 if opts['unified'] is None else opts['unified']
         
         if not os.path.exists(file1):
             self.print_error(f"File not found: {file1}")
@@ -936,47 +3941,99 @@ class AdvancedCMD:
         if not os.path.exists(file2):
             self.print_error(f"File not found: {file2}")
             return
+        if context < 0:
+            self.print_error("Context lines must not be negative")
+            return
         
         print(f"{Fore.CYAN}Comparing files: {file1} <-> {file2}{Style.RESET_ALL}")
         
         try:
-            with open(file1, 'r', encoding='utf-8', errors='ignore') as f1:
-                lines1 = f1.readlines()
-            with open(file2, 'r', encoding='utf-8', errors='ignore') as f2:
-                lines2 = f2.readlines()
-            
-            diff = list(difflib.unified_diff(lines1, lines2, 
-                                           fromfile=file1, tofile=file2, lineterm=''))
-            
-            if not diff:
-                self.print_success("Files are identical")
-                return
-            
-            print(f"\n{Fore.YELLOW}Differences found:{Style.RESET_ALL}")
-            
-            for line in diff:
-                if line.startswith('---') or line.startswith('+++'):
-                    print(f"{Fore.BLUE}{line}{Style.RESET_ALL}")
-                elif line.startswith('@@'):
-                    print(f"{Fore.MAGENTA}{line}{Style.RESET_ALL}")
-                elif line.startswith('+'):
-                    print(f"{Fore.GREEN}{line}{Style.RESET_ALL}")
-                elif line.startswith('-'):
-                    print(f"{Fore.RED}{line}{Style.RESET_ALL}")
-                else:
-                    print(line, end='')
-            
-            added = len([line for line in diff if line.startswith('+')])
-            removed = len([line for line in diff if line.startswith('-')])
-            
-            print(f"\n{Fore.CYAN}Statistics:{Style.RESET_ALL}")
-            print(f"  Lines added: {Fore.GREEN}{added}{Style.RESET_ALL}")
-            print(f"  Lines removed: {Fore.RED}{removed}{Style.RESET_ALL}")
-            
+            added, removed = self.diff_files(file1, file2, context, opts['ignore_space'], opts['stat'],
+                                             banner=f"\n{Fore.YELLOW}Differences found:{Style.RESET_ALL}")
         except Exception as e:
             self.print_error(f"File comparison failed: {e}")
+            return
+        
+        if not added and not removed:
+            self.print_success("Files are identical")
+            return
+        
+        print(f"\n{Fore.CYAN}Statistics:{Style.RESET_ALL}")
+        print(f"  Lines added: {Fore.GREEN}{added}{Style.RESET_ALL}")
+        print(f"  Lines removed: {Fore.RED}{removed}{Style.RESET_ALL}")
+
+    def diff_files(self, file1, file2, context=3, ignore_space=False, stat=False, banner=None):
+        # Prints a unified diff as hunks are found (banner first, if any);
+        # returns the numbers of added and removed lines.
+        first = second = None
+        added = removed = 0
+        try:
+            first = DiffInput(file1)
+            second = DiffInput(file2)
+            if not index_diff(first, second, context, ignore_space):
+                return 0, 0
+            blocks = diff_matches(first.ids, 0, len(first.ids), second.ids, 0, len(second.ids))
+            for hunk in diff_hunks(blocks, len(first.ids), len(second.ids), context):
+                self.check_cancelled()
+                if stat:
+                    removed += sum(i2 - i1 for i1, i2, j1, j2 in hunk)
+                    added += sum(j2 - j1 for i1, i2, j1, j2 in hunk)
+                    continue
+                if not added and not removed:
+                    if banner:
+                        print(banner)
+                    print(f"{Fore.BLUE}--- {file1}{Style.RESET_ALL}")
+                    print(f"{Fore.BLUE}+++ {file2}{Style.RESET_ALL}")
+                hunk_added, hunk_removed = self.print_hunk(first, second, hunk, context)
+                added += hunk_added
+                removed += hunk_removed
+        finally:
+            for side in (first, second):
+                if side is not None:
+                    side.close()
+        return added, removed
 
+    def print_hunk(self, first, second, hunk, context):
+        def span(start, stop):
+            if stop - start == 1:
+                return f"{start + 1}"
+            return f"{start + 1 if stop > start else start},{stop - start}"
+        
+        def show(side, lo, hi, color, mark):
+            # Prints lines lo..hi as slices of the mapped file, 10000 lines at a time.
+            for start in range(lo, hi, 10000):
+                stop = min(hi, start + 10000)
+                text = side.data[side.starts[start]:side.starts[stop] - 1].decode('utf-8', errors='replace')
+                if color:
+                    print(f"{color}{mark}{text.replace(chr(10), f'{Style.RESET_ALL}{chr(10)}{color}{mark}')}"
+                          f"{Style.RESET_ALL}")
+                else:
+                    print(f"{mark}{text.replace(chr(10), chr(10) + mark)}")
+            if hi > lo and side.noeol and hi == len(side.ids):
+                print("\\ No newline at end of file")
+        
+        i1, j1 = hunk[0][0], hunk[0][2]
+        start_a = max(0, i1 - context)
+        start_b = j1 - (i1 - start_a)
+        end_a = min(len(first.ids), hunk[-1][1] + context)
+        end_b = hunk[-1][3] + (end_a - hunk[-1][1])
+        print(f"{Fore.MAGENTA}@@ -{span(first.base + start_a, first.base + end_a)} "
+              f"+{span(second.base + start_b, second.base + end_b)} @@{Style.RESET_ALL}")
+        added = removed = 0
+        pos = start_a
+        for i1, i2, j1, j2 in hunk:
+            show(first, pos, i1, "", " ")
+            show(first, i1, i2, Fore.RED, "-")
+            show(second, j1, j2, Fore.GREEN, "+")
+            removed += i2 - i1
+            added += j2 - j1
+            pos = i2
+        show(first, pos, end_a, "", " ")
+        return added, removed
+    
+    @command("weather", "Utilities & Tools", "[city]", "fetch current weather information for city", network=True, blocking=True)
     def cmd_weather(self, args):
+        import requests
         if not args:
             city = "London"
         else:
@@ -993,13 +4050,395 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Weather fetch failed: {e}")            
 
-#FUN & GAMES:
+    def file_digests(self, files, algo='sha256'):
+        # files are (path, stat_result) pairs. Digests come from the digest
+        # cache when size, mtime and inode still match; the rest are read on
+        # a thread pool. Returns ({path: digest}, [errors]).
+        cache = DigestCache(self.digest_cache_file)
+        full = {path: os.path.abspath(path) for path, st in files}
+        cached = cache.load(list(set(full.values())), algo)
+        digests = {}
+        todo = []
+        for path, st in files:
+            row = cached.get(full[path])
+            if row and row[:3] == (st.st_size, st.st_mtime_ns, st.st_ino):
+                digests[path] = row[3]
+            else:
+                todo.append((path, st))
+        
+        def read(item):
+            try:
+                return file_digest(item[0], algo)
+            except OSError as e:
+                return e
+        
+        errors = []
+        fresh = []
+        pool = ThreadPoolExecutor(min(32, (os.cpu_count() or 1) * 2))
+        try:
+            for (path, st), digest in zip(todo, pool.map(read, todo)):
+                self.check_cancelled()
+                if isinstance(digest, OSError):
+                    errors.append(f"{path}: {digest}")
+                    continue
+                digests[path] = digest
+                fresh.append((full[path], st, digest))
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        if fresh:
+            cache.save(fresh, algo)
+        return digests, errors
 
-    def cmd_ascii(self, args):
-        if not args:
-            self.print_error("Usage: ascii <text>")
+    @command("dirdiff", "Utilities & Tools", "<folder1> <folder2> [--checksum] [--diff]",
+             "compare two folder trees and list added, removed and changed files", min_args=2, blocking=True,
+             options={"--checksum": bool, "-c": "--checksum", "--diff": bool})
+    def cmd_dirdiff(self, args, opts):
+        import stat
+        first, second = args[0], args[1]
+        for folder in (first, second):
+            if not os.path.isdir(folder):
+                self.print_error(f"Folder not found: {folder}")
+                return
+        
+        print(f"{Fore.CYAN}Comparing folders: {first} <-> {second}{Style.RESET_ALL}")
+        started = time.perf_counter()
+        
+        # Both trees are walked at once; the second in a helper thread.
+        stop = threading.Event()
+        
+        def stopped():
+            if stop.is_set():
+                raise JobCancelled()
+        
+        def listing(root, check):
+            walker = TreeWalker(hidden=True, check=check)
+            return {os.path.relpath(os.path.join(path, name), root): st
+                    for path, depth, dirs, files in walker.walk(root) for name, st in files}
+        
+        pool = ThreadPoolExecutor(1)
+        try:
+            other = pool.submit(listing, second, stopped)
+            left = listing(first, self.check_cancelled)
+            right = other.result()
+        finally:
+            stop.set()
+            pool.shutdown(wait=True)
+        
+        added = sorted(right.keys() - left.keys())
+        removed = sorted(left.keys() - right.keys())
+        changed = []
+        unsure = []
+        same = 0
+        for name in sorted(left.keys() & right.keys()):
+            a, b = left[name], right[name]
+            if stat.S_ISLNK(a.st_mode) or stat.S_ISLNK(b.st_mode):
+                try:
+                    differs = os.readlink(os.path.join(first, name)) != os.readlink(os.path.join(second, name))
+                except OSError:
+                    differs = True
+            elif a.st_size != b.st_size:
+                differs = True
+            elif a.st_mtime_ns == b.st_mtime_ns and not opts['checksum']:
+                differs = False
+            else:
+                unsure.append(name)
+                continue
+            if differs:
+                changed.append(name)
+            else:
+                same += 1
+        
+        # Same size but different mtimes (or --checksum): compare contents.
+        errors = []
+        if unsure:
+            digests, errors = self.file_digests([(os.path.join(first, name), left[name]) for name in unsure] +
+                                                [(os.path.join(second, name), right[name]) for name in unsure])
+            for name in unsure:
+                digest_a = digests.get(os.path.join(first, name))
+                digest_b = digests.get(os.path.join(second, name))
+                if digest_a is None or digest_b is None:
+                    continue
+                if digest_a != digest_b:
+                    changed.append(name)
+                else:
+                    same += 1
+            changed.sort()
+        
+        for name in added:
+            print(f"  {Fore.GREEN}+ {name}{Style.RESET_ALL}")
+        for name in removed:
+            print(f"  {Fore.RED}- {name}{Style.RESET_ALL}")
+        for name in changed:
+            print(f"  {Fore.YELLOW}~ {name}{Style.RESET_ALL}")
+        for error in errors:
+            self.print_error(f"Could not read {error}")
+        
+        if opts['diff']:
+            for name in changed:
+                self.check_cancelled()
+                path_a, path_b = os.path.join(first, name), os.path.join(second, name)
+                if not (stat.S_ISREG(left[name].st_mode) and stat.S_ISREG(right[name].st_mode)):
+                    continue
+                try:
+                    with open(path_a, 'rb') as fa, open(path_b, 'rb') as fb:
+                        binary = b'\0' in fa.read(8192) or b'\0' in fb.read(8192)
+                    print()
+                    if binary:
+                        print(f"Binary files {path_a} and {path_b} differ")
+                    else:
+                        self.diff_files(path_a, path_b)
+                except OSError as e:
+                    self.print_error(f"Could not diff {name}: {e}")
+        
+        elapsed = time.perf_counter() - started
+        if not (added or removed or changed or errors):
+            self.print_success(f"Folders are identical ({same} files, {elapsed:.2f}s)")
+            return
+        print(f"\n{Fore.CYAN}Summary:{Style.RESET_ALL} {len(added)} added, {len(removed)} removed, "
+              f"{len(changed)} changed, {same} identical ({len(unsure)} compared by content, {elapsed:.2f}s)")
+
+    @command("hash", "Utilities & Tools", "[--algo sha256|blake2b|md5|sha1|sha512] <paths...> | --check <manifest>",
+             "print or check sha256sum-style checksums of files and folders", min_args=1, blocking=True,
+             options={"--algo": str, "-a": "--algo", "--check": bool, "-c": "--check"})
+    def cmd_hash(self, args, opts):
+        import stat
+        algo = opts['algo'] and opts['algo'].lower()
+        if algo is not None and algo not in HASH_ALGORITHMS:
+            self.print_error(f"Unknown algorithm: {opts['algo']} (use {', '.join(HASH_ALGORITHMS)})")
+            return
+        if opts['check']:
+            self.check_hashes(args, algo)
+            return
+        
+        files = []
+        for path in args:
+            if os.path.isdir(path):
+                walker = TreeWalker(hidden=True, check=self.check_cancelled)
+                files.extend(sorted((os.path.join(root, name), st) for root, depth, dirs, entries in walker.walk(path)
+                                    for name, st in entries if stat.S_ISREG(st.st_mode)))
+                continue
+            try:
+                files.append((path, os.stat(path)))
+            except OSError as e:
+                self.print_error(f"{path}: {e}")
+        
+        digests, errors = self.file_digests(files, algo or 'sha256')
+        for path, st in files:
+            if path in digests:
+                print(self.checksum_line(digests[path], path))
+        for error in errors:
+            self.print_error(error)
+
+    def checksum_line(self, digest, path):
+        # Like sha256sum: names with a backslash or newline are escaped and
+        # the line starts with a backslash.
+        if '\\' in path or '\n' in path:
+            escaped = path.replace('\\', '\\\\').replace('\n', '\\n')
+            return f"\\{digest}  {escaped}"
+        return f"{digest}  {path}"
+
+    def check_hashes(self, manifests, algo):
+        import stat
+        pattern = re.compile(r'^(\\?)([0-9a-fA-F]+) [ *](.*)$')
+        lengths = {64: 'sha256', 128: 'sha512', 32: 'md5', 40: 'sha1'}
+        expected = []
+        for manifest in manifests:
+            # sha512 and blake2b digests are both 128 hex digits; b2sum-style
+            # manifest names pick blake2b, anything else sha512.
+            name = os.path.basename(manifest).lower()
+            long_algo = 'blake2b' if 'b2' in name or 'blake2' in name else 'sha512'
+            try:
+                with open(manifest, 'r', encoding='utf-8', errors='surrogateescape') as f:
+                    for number, line in enumerate(f, 1):
+                        match = pattern.match(line.rstrip('\n'))
+                        if not match:
+                            if line.strip():
+                                self.print_warning(f"{manifest}:{number}: improperly formatted checksum line")
+                            continue
+                        escaped, digest, path = match.groups()
+                        if escaped:
+                            path = re.sub(r'\\(.)', lambda m: '\n' if m.group(1) == 'n' else m.group(1), path)
+                        file_algo = long_algo if len(digest) == 128 else lengths.get(len(digest), 'sha256')
+                        expected.append((path, digest.lower(), algo or file_algo))
+            except OSError as e:
+                self.print_error(f"Cannot read {manifest}: {e}")
+        
+        files = {}
+        for path, digest, file_algo in expected:
+            try:
+                st = os.stat(path)
+                if stat.S_ISREG(st.st_mode):
+                    files.setdefault(file_algo, []).append((path, st))
+            except OSError:
+                pass
+        digests = {}
+        for file_algo, group in files.items():
+            found, errors = self.file_digests(list(dict.fromkeys(group)), file_algo)
+            digests.update(((path, file_algo), digest) for path, digest in found.items())
+        if algo is None:
+            # A guessed 128-digit algorithm that does not match gets one
+            # retry with the other one.
+            other = {'sha512': 'blake2b', 'blake2b': 'sha512'}
+            retry = {}
+            for index, (path, digest, file_algo) in enumerate(expected):
+                actual = digests.get((path, file_algo))
+                if file_algo in other and actual is not None and actual != digest:
+                    retry.setdefault(other[file_algo], {})[index] = path
+            for file_algo, indexes in retry.items():
+                group = [(path, st) for path, st in files[other[file_algo]] if path in indexes.values()]
+                found, errors = self.file_digests(list(dict.fromkeys(group)), file_algo)
+                digests.update(((path, file_algo), digest) for path, digest in found.items())
+                for index, path in indexes.items():
+                    if found.get(path) == expected[index][1]:
+                        expected[index] = (path, expected[index][1], file_algo)
+        
+        failed = unreadable = 0
+        for path, digest, file_algo in expected:
+            actual = digests.get((path, file_algo))
+            if actual is None:
+                unreadable += 1
+                print(f"{path}: {Fore.RED}FAILED open or read{Style.RESET_ALL}")
+            elif actual != digest:
+                failed += 1
+                print(f"{path}: {Fore.RED}FAILED{Style.RESET_ALL}")
+            else:
+                print(f"{path}: {Fore.GREEN}OK{Style.RESET_ALL}")
+        if unreadable:
+            self.print_error(f"{unreadable} listed file(s) could not be read")
+        if failed:
+            self.print_error(f"{failed} computed checksum(s) did NOT match")
+            if failed == len(expected):
+                self.print_warning(f"No checksum matched; if the manifest uses another algorithm, "
+                                   f"pass it with --algo ({', '.join(HASH_ALGORITHMS)})")
+
+    @command("dupes", "Utilities & Tools", "<folder> [--min-size <size>] [--link]",
+             "find duplicate files and the space they take", min_args=1, blocking=True,
+             options={"--min-size": parse_size, "--link": bool})
+    def cmd_dupes(self, args, opts):
+        import stat
+        folder = args[0]
+        if not os.path.isdir(folder):
+            self.print_error(f"Folder not found: {folder}")
+            return
+        min_size = max(1, opts['min_size'] or 1)
+        
+        print(f"{Fore.CYAN}Looking for duplicate files in {folder}...{Style.RESET_ALL}")
+        started = time.perf_counter()
+        
+        # Only files sharing a size can be duplicates; hard links to one
+        # inode are one file and take no extra space.
+        by_size = {}
+        inodes = set()
+        scanned = 0
+        walker = TreeWalker(hidden=True, check=self.check_cancelled)
+        for root, depth, dirs, files in walker.walk(folder):
+            for name, st in files:
+                if not stat.S_ISREG(st.st_mode) or st.st_size < min_size:
+                    continue
+                scanned += 1
+                if (st.st_dev, st.st_ino) in inodes:
+                    continue
+                inodes.add((st.st_dev, st.st_ino))
+                by_size.setdefault(st.st_size, []).append((os.path.join(root, name), st))
+        groups = [group for group in by_size.values() if len(group) > 1]
+        candidates = sum(len(group) for group in groups)
+        
+        # Then the first and last blocks, then full hashes of what still collides.
+        groups = self.split_groups(groups, lambda path, st: edge_digest(path, st.st_size))
+        big = [group for group in groups if group[0][1].st_size > 2 * DUPES_EDGE_BYTES]
+        groups = [group for group in groups if group[0][1].st_size <= 2 * DUPES_EDGE_BYTES]
+        errors = []
+        if big:
+            digests, errors = self.file_digests([item for group in big for item in group])
+            groups += self.split_groups(big, lambda path, st: digests.get(path))
+        groups = sorted((sorted(group, key=lambda item: item[0]) for group in groups),
+                        key=lambda group: group[0][1].st_size * (len(group) - 1), reverse=True)
+        elapsed = time.perf_counter() - started
+        
+        for error in errors:
+            self.print_error(f"Could not read {error}")
+        if not groups:
+            self.print_success(f"No duplicates among {scanned} files ({elapsed:.2f}s)")
             return
         
+        reclaimable = 0
+        for group in groups:
+            size = group[0][1].st_size
+            reclaimable += size * (len(group) - 1)
+            print(f"\n{Fore.YELLOW}{len(group)} x {self.format_bytes(size)} "
+                  f"({self.format_bytes(size * (len(group) - 1))} reclaimable){Style.RESET_ALL}")
+            for path, st in group:
+                print(f"  {path}")
+        
+        print(f"\n{Fore.CYAN}Summary:{Style.RESET_ALL} {len(groups)} groups, "
+              f"{sum(len(group) - 1 for group in groups)} duplicate files, "
+              f"{self.format_bytes(reclaimable)} reclaimable")
+        print(f"  Scanned {scanned} files ({scanned - len(inodes)} hard links skipped, "
+              f"{candidates} with a shared size) in {elapsed:.2f}s")
+        
+        if opts['link']:
+            self.link_duplicates(groups)
+
+    def split_groups(self, groups, key):
+        # Splits each group of (path, stat) pairs by key(path, stat), computed
+        # on a thread pool. Unreadable files and singletons are dropped.
+        def safe_key(item):
+            try:
+                return key(*item)
+            except OSError:
+                return None
+        
+        items = [item for group in groups for item in group]
+        keys = []
+        pool = ThreadPoolExecutor(min(32, (os.cpu_count() or 1) * 4))
+        try:
+            for value in pool.map(safe_key, items):
+                self.check_cancelled()
+                keys.append(value)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        
+        result = []
+        keys = iter(keys)
+        for group in groups:
+            buckets = {}
+            for item, value in zip(group, keys):
+                if value is not None:
+                    buckets.setdefault(value, []).append(item)
+            result.extend(bucket for bucket in buckets.values() if len(bucket) > 1)
+        return result
+
+    def link_duplicates(self, groups):
+        # Keeps the first file of each group and atomically replaces the
+        # others with hard links to it, unless they changed since hashing.
+        linked = freed = 0
+        for group in groups:
+            keep, keep_st = group[0]
+            for path, st in group[1:]:
+                self.check_cancelled()
+                try:
+                    current = os.stat(path)
+                    if current.st_dev != keep_st.st_dev:
+                        self.print_warning(f"Skipped {path}: on another filesystem than {keep}")
+                        continue
+                    if (current.st_size, current.st_mtime_ns) != (st.st_size, st.st_mtime_ns):
+                        self.print_warning(f"Skipped {path}: changed since it was hashed")
+                        continue
+                    temp = f"{path}.{os.getpid()}.link"
+                    os.link(keep, temp)
+                    os.replace(temp, path)
+                except OSError as e:
+                    self.print_error(f"Could not link {path}: {e}")
+                    continue
+                linked += 1
+                freed += st.st_size
+        self.print_success(f"Replaced {linked} duplicates with hard links, freeing {self.format_bytes(freed)}")
+
+#FUN & GAMES:
+
+    @command("ascii", "Fun & Games", "<text>", "generate ASCII art from input text", min_args=1)
+    def cmd_ascii(self, args):
+        import pyfiglet
         text = " ".join(args)
         try:
             ascii_art = pyfiglet.figlet_format(text)
@@ -1007,17 +4446,15 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"ASCII art generation failed: {e}")
 
+    @command("asciiart", "Fun & Games", "<image_file>", "convert image file to ASCII art representation", min_args=1)
     def cmd_asciiart(self, args):
-        if not args:
-            self.print_error("Usage: asciiart <image_file>")
-            return
-        
         image_path = args[0]
         if not os.path.exists(image_path):
             self.print_error(f"Image file not found: {image_path}")
             return
         
         try:
+            from PIL import Image
             ascii_chars = "@%#*+=-:. "
             
             with Image.open(image_path) as img:
@@ -1038,8 +4475,7 @@ class AdvancedCMD:
                 print(f"{Fore.CYAN}ASCII Art from {image_path}:{Style.RESET_ALL}")
                 print(ascii_img)
                 
-                save = input("Save ASCII art to file? (y/N): ").lower()
-                if save == 'y':
+                if self.confirm("Save ASCII art to file? (y/N): "):
                     output_file = f"{os.path.splitext(image_path)[0]}_ascii.txt"
                     with open(output_file, 'w') as f:
                         f.write(ascii_img)
@@ -1050,6 +4486,7 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"ASCII art conversion failed: {e}")
 
+    @command("matrix", "Fun & Games", "", "display falling green Matrix-style text effect", interactive=True)
     def cmd_matrix(self, args):
         print(f"{Fore.GREEN}Press Ctrl+C to stop the Matrix effect...{Style.RESET_ALL}")
         
@@ -1068,15 +4505,17 @@ class AdvancedCMD:
                         matrix[row][col] = matrix[row - 1][col]
                         matrix[row - 1][col] = ' '
                 
-                os.system('cls' if os.name == 'nt' else 'clear')
+                self.clear_screen()
                 for row in matrix:
                     print(f"{Fore.GREEN}{''.join(row)}{Style.RESET_ALL}")
+                sys.stdout.flush()
                 
                 time.sleep(0.1)
                 
         except KeyboardInterrupt:
             print(f"\n{Fore.GREEN}Matrix effect stopped.{Style.RESET_ALL}")
 
+    @command("snake", "Fun & Games", "", "play classic Snake game in console", interactive=True)
     def cmd_snake(self, args):
         print(f"{Fore.GREEN} Snake Game - Use WASD keys, Q to quit{Style.RESET_ALL}")
         print("This is a simplified version. Press Enter to continue...")
@@ -1089,7 +4528,7 @@ class AdvancedCMD:
         score = 0
         
         def draw_game():
-            os.system('cls' if os.name == 'nt' else 'clear')
+            self.clear_screen()
             print(f"{Fore.GREEN}Snake Game - Score: {score} - WASD to move, Q to quit{Style.RESET_ALL}")
             
             print("┌" + "─" * width + "┐")
@@ -1147,11 +4586,8 @@ class AdvancedCMD:
         except KeyboardInterrupt:
             print(f"\n{Fore.YELLOW}Game interrupted{Style.RESET_ALL}")
 
+    @command("rps", "Fun & Games", "<rock|paper|scissors>", "play Rock-Paper-Scissors (rock/paper/scissors)", min_args=1)
     def cmd_rps(self, args):
-        if not args:
-            self.print_error("Usage: rps <rock|paper|scissors>")
-            return
-        
         user_choice = args[0].lower()
         valid_choices = ['rock', 'paper', 'scissors']
         
@@ -1173,11 +4609,8 @@ class AdvancedCMD:
         else:
             print(f"{Fore.RED}Computer wins!{Style.RESET_ALL}")
 
+    @command("mindmap", "Fun & Games", "<central_topic>", "generate simple ASCII mind map structure", min_args=1)
     def cmd_mindmap(self, args):
-        if not args:
-            self.print_error("Usage: mindmap <central_topic>")
-            return
-        
         topic = " ".join(args)
         
         print(f"{Fore.CYAN}Mind Map for: {topic}{Style.RESET_ALL}")
@@ -1234,11 +4667,9 @@ class AdvancedCMD:
 
 #ADVANCED:
 
+    @command("encrypt", "Advanced", "<filename>", "encrypt file with password protection", min_args=1, interactive=True)
     def cmd_encrypt(self, args):
-        if not args:
-            self.print_error("Usage: encrypt <filename>")
-            return
-        
+        from cryptography.fernet import Fernet
         filename = args[0]
         if not os.path.exists(filename):
             self.print_error(f"File not found: {filename}")
@@ -1264,19 +4695,16 @@ class AdvancedCMD:
             
             self.print_success(f"File encrypted: {encrypted_filename}")
             
-            remove_original = input("Remove original file? (y/N): ").lower()
-            if remove_original == 'y':
+            if self.confirm("Remove original file? (y/N): "):
                 os.remove(filename)
                 print("Original file removed")
                 
         except Exception as e:
             self.print_error(f"Encryption failed: {e}")
 
+    @command("decrypt", "Advanced", "<encrypted_filename>", "decrypt encrypted file with password", min_args=1, interactive=True)
     def cmd_decrypt(self, args):
-        if not args:
-            self.print_error("Usage: decrypt <encrypted_filename>")
-            return
-        
+        from cryptography.fernet import Fernet
         filename = args[0]
         if not os.path.exists(filename):
             self.print_error(f"File not found: {filename}")
@@ -1309,6 +4737,7 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Decryption failed: {e}")
 
+    @command("pwgen", "Advanced", "[length] [nosymbols]", "generate secure random password")
     def cmd_pwgen(self, args):
         length = 16
         include_symbols = True
@@ -1373,6 +4802,7 @@ class AdvancedCMD:
         
         return min(score, 100)
 
+    @command("translate", "Advanced", "<text> <target_language>", "translate text to specified language")
     def cmd_translate(self, args):
         if len(args) < 2:
             self.print_error("Usage: translate <text> <target_language>")
@@ -1422,6 +4852,7 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Translation failed: {e}")
 
+    @command("agenda", "Advanced", "[add <YYYY-MM-DD> <HH:MM|allday> <title> | list | remove <id>]", "calendar and appointment manager")
     def cmd_agenda(self, args):
         if not args:
             today = datetime.date.today()
@@ -1508,19 +4939,16 @@ class AdvancedCMD:
 
 #SYSTEM MANAGEMENT:
 
+    @command("kill", "System Management", "<PID>", "terminate process by Process ID", min_args=1, uses_psutil=True)
     def cmd_kill(self, args):
-        if not args:
-            self.print_error("Usage: kill <PID>")
-            return
-        
+        import psutil
         try:
             pid = int(args[0])
             process = psutil.Process(pid)
             process_name = process.name()
             
             if process_name.lower() in ['explorer.exe', 'winlogon.exe', 'csrss.exe', 'system']:
-                confirm = input(f"{Fore.YELLOW}Warning: {process_name} is a system process. Continue? (y/N): {Style.RESET_ALL}")
-                if confirm.lower() != 'y':
+                if not self.confirm(f"{Fore.YELLOW}Warning: {process_name} is a system process. Continue? (y/N): {Style.RESET_ALL}"):
                     print("Operation cancelled.")
                     return
             
@@ -1543,7 +4971,9 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"Failed to kill process: {e}")
 
+    @command("syslog", "System Management", "", "display system logs and recent events", uses_psutil=True)
     def cmd_syslog(self, args):
+        import psutil
         print(f"{Fore.CYAN}System Logs and Events{Style.RESET_ALL}")
         
         try:
@@ -1582,19 +5012,9 @@ class AdvancedCMD:
             process_count = len(psutil.pids())
             print(f"  Total processes: {process_count}")
             
-            processes = []
-            for proc in psutil.process_iter(['pid', 'name', 'cpu_percent']):
-                try:
-                    processes.append(proc.info)
-                except:
-                    continue
-            
-            processes.sort(key=lambda x: x.get('cpu_percent', 0), reverse=True)
             print(f"  Top CPU processes:")
-            for proc in processes[:5]:
-                name = proc.get('name', 'Unknown')[:20]
-                cpu = proc.get('cpu_percent', 0)
-                print(f"    {name}: {cpu:.1f}%")
+            for proc in self.cpu.top_processes(5):
+                print(f"    {proc['name'][:20] or 'Unknown'}: {proc['cpu_percent']:.1f}%")
             
             memory = psutil.virtual_memory()
             print(f"\n{Fore.YELLOW}Memory Status:{Style.RESET_ALL}")
@@ -1605,48 +5025,457 @@ class AdvancedCMD:
         except Exception as e:
             self.print_error(f"System log access failed: {e}")
 
+#JOBS:
+
+    def start_job(self, command):
+        parts = command.split()
+        if not parts:
+            self.print_error("Usage: <command> &")
+            return 1
+        spec = COMMANDS.get(parts[0].lower())
+        if spec is not None and spec.interactive:
+            self.print_error(f"'{spec.name}' needs an interactive terminal and cannot run in the background")
+            return 1
+        if self.job_pool is None:
+            self.job_pool = ThreadPoolExecutor(max_workers=self.max_jobs, thread_name_prefix="job")
+            if not isinstance(sys.stdout, JobOutput):
+                sys.stdout = JobOutput(sys.stdout)
+        job = Job(self.next_job_id, command)
+        self.next_job_id += 1
+        self.jobs[job.id] = job
+        job.future = self.job_pool.submit(self.run_job, job)
+        print(f"[{job.id}] {command}")
+        return 0
+
+    def run_job(self, job):
+        if job.cancel_event.is_set():
+            job.state = "cancelled"
+            return
+        thread_state.job = job
+        self.local.errors = 0
+        job.state = "running"
+        job.started = time.time()
+        try:
+            job.status = self.execute(job.command)
+            job.state = "done" if job.status == 0 else "failed"
+        except JobCancelled:
+            job.status = 130
+            job.state = "cancelled"
+        finally:
+            job.finished = time.time()
+            thread_state.job = None
+            with job.changed:
+                job.changed.notify_all()
+
+    def get_job(self, args):
+        try:
+            job = self.jobs.get(int(args[0].lstrip('%')))
+        except ValueError:
+            job = None
+        if job is None:
+            self.print_error(f"No such job: {args[0]}")
+        return job
+
+    def job_finished(self, job):
+        return job.future.done()
+
+    def report_jobs(self):
+        for job in self.jobs.values():
+            if not job.reported and self.job_finished(job):
+                job.reported = True
+                color = Fore.GREEN if job.state == "done" else Fore.RED
+                print(f"{color}[{job.id}] {job.state.title()} ({job.elapsed():.1f}s)  {job.command}{Style.RESET_ALL}")
+
+    @command("jobs", "System Management", "", "list background jobs started with a trailing '&'")
+    def cmd_jobs(self, args):
+        if not self.jobs:
+            print("No background jobs.")
+            return
+        print(f"{'ID':<5} {'State':<10} {'Time':>8}  {'Command'}")
+        print("-" * 60)
+        for job in self.jobs.values():
+            if self.job_finished(job):
+                job.reported = True
+            print(f"{job.id:<5} {job.state:<10} {job.elapsed():>7.1f}s  {job.command}")
+
+    @command("wait", "System Management", "[id]", "wait for one background job (or all) to finish")
+    def cmd_wait(self, args):
+        if args:
+            job = self.get_job(args)
+            if job is None:
+                return
+            waiting = [job]
+        else:
+            waiting = list(self.jobs.values())
+        for job in waiting:
+            job.future.result()
+            job.reported = True
+            color = Fore.GREEN if job.state == "done" else Fore.RED
+            print(f"{color}[{job.id}] {job.state.title()} ({job.elapsed():.1f}s)  {job.command}{Style.RESET_ALL}")
+
+    @command("fg", "System Management", "<id>", "show a job's output, following it until it finishes", min_args=1)
+    def cmd_fg(self, args):
+        job = self.get_job(args)
+        if job is None:
+            return
+        shown = 0
+        try:
+            while True:
+                with job.changed:
+                    while len(job.chunks) == shown and not self.job_finished(job):
+                        job.changed.wait(0.5)
+                    chunks = job.chunks[shown:]
+                    shown += len(chunks)
+                sys.stdout.write("".join(chunks))
+                sys.stdout.flush()
+                if self.job_finished(job) and shown == len(job.chunks):
+                    break
+        except KeyboardInterrupt:
+            print(f"\n{Fore.YELLOW}Stopped following job {job.id}; it keeps running.{Style.RESET_ALL}")
+            return
+        job.reported = True
+        print(f"[{job.id}] {job.state.title()} ({job.elapsed():.1f}s)  {job.command}")
+
+    @command("cancel", "System Management", "<id>", "cancel a pending or running background job", min_args=1)
+    def cmd_cancel(self, args):
+        job = self.get_job(args)
+        if job is None:
+            return
+        if self.job_finished(job):
+            self.print_warning(f"Job {job.id} has already finished")
+            return
+        job.cancel_event.set()
+        if job.future.cancel():
+            job.state = "cancelled"
+            self.print_success(f"Job {job.id} cancelled")
+        else:
+            self.print_success(f"Cancellation requested for job {job.id}")
+
+    def shutdown_jobs(self):
+        if self.job_pool is None:
+            return
+        running = [job for job in self.jobs.values() if not self.job_finished(job)]
+        if running:
+            self.print_warning(f"Stopping {len(running)} background job(s)...")
+        for job in running:
+            job.cancel_event.set()
+        self.job_pool.shutdown(wait=True, cancel_futures=True)
+        self.job_pool = None
+
+#DIAGNOSTICS:
+
+    def peak_rss(self):
+        try:
+            import resource
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+        except ImportError:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss)
+
+    @command("time", "System Management", "<command>", "run a command and report wall time, CPU time and peak memory", min_args=1)
+    def cmd_time(self, args):
+        line = " ".join(args)
+        rss_before = self.peak_rss()
+        cpu_before = os.times()
+        started = time.perf_counter()
+        status = self.execute(line)
+        wall = time.perf_counter() - started
+        cpu_after = os.times()
+        rss_after = self.peak_rss()
+        
+        user = (cpu_after.user - cpu_before.user) + (cpu_after.children_user - cpu_before.children_user)
+        system = (cpu_after.system - cpu_before.system) + (cpu_after.children_system - cpu_before.children_system)
+        print(f"\n{Fore.CYAN}Timing for: {line}{Style.RESET_ALL}")
+        print(f"  Wall time:  {wall:.3f} s")
+        print(f"  CPU time:   {user + system:.3f} s (user {user:.3f} s, system {system:.3f} s)")
+        print(f"  CPU usage:  {(user + system) / wall * 100 if wall > 0 else 0:.0f}%")
+        print(f"  Peak RSS:   {self.format_bytes(rss_after)} (+{self.format_bytes(max(0, rss_after - rss_before))})")
+        print(f"  Exit status: {status}")
+        return status
+
+    @command("profile", "System Management", "[--top <n>] [--sort cumulative|tottime|calls] <command>",
+             "run a command under cProfile and show the most expensive functions", min_args=1,
+             options={"--top": int, "--sort": str}, options_first=True)
+    def cmd_profile(self, args, opts):
+        import cProfile
+        import pstats
+        sort = opts['sort'] or 'cumulative'
+        if sort not in ('cumulative', 'tottime', 'calls', 'ncalls', 'time'):
+            self.print_error(f"Unknown sort key: {sort}")
+            return
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            self.execute(" ".join(args))
+        finally:
+            profiler.disable()
+        print(f"\n{Fore.CYAN}Profile for: {' '.join(args)}{Style.RESET_ALL}")
+        pstats.Stats(profiler, stream=sys.stdout).strip_dirs().sort_stats(sort).print_stats(opts['top'] or 20)
+
+    @command("stats", "System Management", "[command] [--reset]", "show per-command latency statistics for this session",
+             options={"--reset": bool})
+    def cmd_stats(self, args, opts):
+        if opts['reset']:
+            self.latency.clear()
+            self.print_success("Latency statistics cleared")
+            return
+        names = [name for name in args if name in self.latency] if args else sorted(self.latency)
+        if not names:
+            print("No commands timed yet.")
+            return
+        
+        def ms(seconds):
+            return f"{seconds * 1000:.1f}ms"
+        
+        print(f"{'Command':<14} {'Count':>7} {'Mean':>10} {'p50':>10} {'p95':>10} {'p99':>10} {'Max':>10} {'Total':>10}")
+        print("-" * 88)
+        for name in sorted(names, key=lambda n: self.latency[n].total, reverse=True):
+            h = self.latency[name]
+            print(f"{name:<14} {h.count:>7} {ms(h.total / h.count):>10} {ms(h.percentile(0.5)):>10} "
+                  f"{ms(h.percentile(0.95)):>10} {ms(h.percentile(0.99)):>10} {ms(h.max):>10} {ms(h.total):>10}")
+
+    def dispatch(self, cmd_name, args):
+        # Returns False for an unknown command, the handler's exit status if
+        # it returned one (run, time, page), and True otherwise.
+        spec = COMMANDS.get(cmd_name)
+        if spec is None:
+            return False
+        if spec.interactive and not self.interactive:
+            self.print_error(f"'{cmd_name}' needs an interactive terminal")
+            return True
+        try:
+            args, opts = spec.parse(args)
+        except UsageError as e:
+            usage = f"Usage: {spec.name} {spec.usage}".rstrip()
+            self.print_error(f"{e} - {usage}" if str(e) else usage)
+            return True
+        handler = spec.handler or spec.resolve()
+        started = time.perf_counter()
+        try:
+            if opts is None:
+                result = handler(self, args)
+            else:
+                result = handler(self, args, opts)
+        finally:
+            histogram = self.latency.get(spec.name)
+            if histogram is None:
+                histogram = self.latency.setdefault(spec.name, LatencyHistogram())
+            histogram.record(time.perf_counter() - started)
+        if isinstance(result, int) and not isinstance(result, bool):
+            return result
+        return True
+
+    def complete(self, text, state):
+        if state == 0:
+            import readline
+            line = readline.get_line_buffer()[:readline.get_begidx()]
+            if not line.strip():
+                self.completions = [name + " " for name in sorted(COMMANDS) if name.startswith(text.lower())]
+            else:
+                folder, prefix = os.path.split(text)
+                try:
+                    names = os.listdir(folder or '.')
+                except OSError:
+                    names = []
+                self.completions = []
+                for name in sorted(names):
+                    if name.startswith(prefix):
+                        path = os.path.join(folder, name)
+                        self.completions.append(path + os.sep if os.path.isdir(path) else path)
+        return self.completions[state] if state < len(self.completions) else None
+
+    def setup_completion(self):
+        try:
+            import readline
+        except ImportError:
+            return
+        readline.set_completer(self.complete)
+        readline.set_completer_delims(" \t")
+        readline.parse_and_bind("tab: complete")
+        # Up/Down search by the typed prefix; Ctrl+R is readline's reverse-i-search.
+        readline.parse_and_bind('"\\e[A": history-search-backward')
+        readline.parse_and_bind('"\\e[B": history-search-forward')
+        for command in self.history.recent(1000):
+            readline.add_history(command)
+
+    def run_pipeline(self, stages):
+        name, args = stages[0][0].lower(), stages[0][1:]
+        spec = COMMANDS[name]
+        try:
+            args, opts = spec.parse(args)
+            records = spec.records(self, args) if opts is None else spec.records(self, args, opts)
+            index = 1
+            while index < len(stages):
+                stage_name, stage_args = stages[index][0].lower(), stages[index][1:]
+                stage = STAGES.get(stage_name)
+                if stage is None:
+                    raise UsageError(f"unknown pipeline stage: {stage_name}")
+                if stage_name == 'sort' and index + 1 < len(stages) and stages[index + 1][0].lower() == 'head':
+                    records = stage_sort(records, stage_args, limit=stage_count(stages[index + 1][1:]))
+                    index += 2
+                    continue
+                records = stage.handler(records, stage_args)
+                index += 1
+            self.print_records(records)
+        except UsageError as e:
+            self.print_error(str(e) or f"Usage: {spec.name} {spec.usage}".rstrip())
+
+    def execute(self, command):
+        # Runs one command line and returns its exit status: 0 on success,
+        # 1 if the command reported an error, or the status the command
+        # returned (a system command's code, 124 for a timeout).
+        try:
+            return self.execute_line(command)
+        finally:
+            sys.stdout.flush()
+
+    def execute_line(self, command):
+        parts = command.split()
+        if not parts:
+            return 0
+        if command.endswith('&') and not command.endswith('&&'):
+            return self.start_job(command[:-1].strip())
+        cmd_name = parts[0].lower()
+        args = parts[1:]
+        errors = self.error_count
+        try:
+            if '|' in command:
+                stages = [part.split() for part in command.split('|')]
+                spec = COMMANDS.get(cmd_name)
+                if spec is not None and spec.records and all(stages):
+                    self.run_pipeline(stages)
+                    return 1 if self.error_count > errors else 0
+            result = self.dispatch(cmd_name, args)
+            if result is not False:
+                if result is not True and result != 0:
+                    return result
+                return 1 if self.error_count > errors else 0
+            status = self.execute_system_command(command)
+            if status in (127, 9009):
+                self.print_error(f"Unknown command: {cmd_name}")
+            return status
+        except ImportError as e:
+            self.print_error(f"Missing required library: {e}")
+            print(INSTALL_HINT)
+        except Exception as e:
+            self.print_error(f"Unexpected error: {e}")
+        return 1
+
     def run(self):
+        self.interactive = True
         self.print_banner()
+        self.setup_completion()
         
         while self.running:
             try:
+                self.report_jobs()
                 command = input(self.get_prompt()).strip()
                 
                 if not command:
                     continue
                 
-                if command != "exit":
-                    self.history.append(command)
-                
-                parts = command.split()
-                cmd_name = parts[0].lower()
-                args = parts[1:] if len(parts) > 1 else []
-                
-                method_name = f"cmd_{cmd_name}"
-                if hasattr(self, method_name):
-                    getattr(self, method_name)(args)
-                elif cmd_name == "exit":
-                    self.print_success("Goodbye!")
-                    self.running = False
+                started = time.perf_counter()
+                if self.output.pager and command.split()[0].lower() not in ('page', 'pager'):
+                    status = self.output.paged(lambda: self.execute(command))
                 else:
-                    if not self.execute_system_command(command):
-                        self.print_error(f"Unknown command: {cmd_name}")
+                    status = self.execute(command)
+                
+                if command != "exit":
+                    self.history.append(command, time.perf_counter() - started, status)
                         
             except KeyboardInterrupt:
                 print(f"\n{Fore.YELLOW}Use 'exit' to quit.{Style.RESET_ALL}")
             except EOFError:
                 print(f"\n{Fore.GREEN}Goodbye!{Style.RESET_ALL}")
                 break
-            except Exception as e:
-                self.print_error(f"Unexpected error: {e}")
+        self.shutdown_jobs()
+
+    def run_batch(self, lines, stop_on_error=False):
+        # Exit status is that of the last failing command, or 0.
+        self.interactive = False
+        status = 0
+        try:
+            for line in lines:
+                command = line.strip()
+                if not command or command.startswith('#'):
+                    continue
+                result = self.execute(command)
+                if result != 0:
+                    status = result
+                    if stop_on_error:
+                        break
+                if not self.running:
+                    break
+            for job_id in list(self.jobs):
+                self.execute(f"fg {job_id}")
+        except KeyboardInterrupt:
+            return 130
+        finally:
+            self.shutdown_jobs()
+            sys.stdout.flush()
+        for job in self.jobs.values():
+            if job.status:
+                status = job.status
+        return status
+
+def parse_arguments(argv):
+    if not argv:
+        # Plain interactive start: skip importing argparse.
+        import types
+        return types.SimpleNamespace(script=None, commands=None, stdin=False, stop_on_error=False,
+                                     no_color=False, pager=False)
+    import argparse
+    parser = argparse.ArgumentParser(prog="AdvancedCMD", description="Advanced CMD shell. Without a script, -c or --stdin the interactive prompt starts.")
+    parser.add_argument("script", nargs="?", help="file with one command per line ('-' reads standard input)")
+    parser.add_argument("-c", dest="commands", metavar="CMD", action="append", help="run CMD and exit (can be repeated)")
+    parser.add_argument("--stdin", action="store_true", help="read commands from standard input")
+    parser.add_argument("-e", "--stop-on-error", action="store_true", help="stop at the first failing command")
+    parser.add_argument("--no-color", action="store_true", help="never print colour codes")
+    parser.add_argument("--pager", action="store_true", help="page long output in the interactive shell")
+    return parser.parse_args(argv)
 
 def main():
+    opts = parse_arguments(sys.argv[1:])
+    output = Output()
+    output.install()
+    batch = bool(opts.commands or opts.script or opts.stdin)
+    # Scripts and -c one-liners print plain text and skip colorama entirely.
+    setup_colors(not batch and output.color_enabled(opts.no_color))
     try:
-        cmd = AdvancedCMD()
-        cmd.run()
+        cmd = AdvancedCMD(output)
     except Exception as e:
         print(f"Failed to start Advanced CMD: {e}")
         sys.exit(1)
 
+    status = 0
+    try:
+        if not batch:
+            output.pager = opts.pager
+            cmd.run()
+        else:
+            status = run_batch_sources(cmd, opts)
+    finally:
+        sys.stdout.flush()
+    sys.exit(status)
+
+def run_batch_sources(cmd, opts):
+    status = 0
+    if opts.commands:
+        status = cmd.run_batch(opts.commands, opts.stop_on_error)
+        if status and opts.stop_on_error:
+            return status
+    if opts.script and opts.script != '-':
+        try:
+            with open(opts.script, 'r', encoding='utf-8') as f:
+                status = cmd.run_batch(f, opts.stop_on_error) or status
+        except OSError as e:
+            print(f"Cannot read script: {e}", file=sys.stderr)
+            return 2
+    elif opts.stdin or opts.script == '-':
+        status = cmd.run_batch(sys.stdin, opts.stop_on_error) or status
+    return status
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()